@@ -0,0 +1,134 @@
+import functools
+import math
+import threading
+import time
+from config import ADMISSION_CONFIG
+from deadlines import current_deadline
+from metrics import metrics
+
+class EndpointLimiter:
+    def __init__(self, concurrency, queue, queue_timeout):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        # Runs immediately under the concurrency limit, waits while fewer
+        # than `queue` requests are already waiting, and otherwise sheds.
+        # Queued requests never wait past their own deadline.
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        with self.condition:
+            if self.active < self.concurrency:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue:
+                return False
+
+            self.waiting += 1
+            try:
+                admitted = self.condition.wait_for(lambda: self.active < self.concurrency, timeout=timeout)
+                if admitted:
+                    self.active += 1
+                return admitted
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+class TokenBuckets:
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, client, cost=1):
+        # Returns 0 when the request may proceed, otherwise the seconds until
+        # enough tokens will have accumulated.
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            cost = min(cost, self.burst)
+            if tokens < cost:
+                self.buckets[client] = (tokens, now)
+                return (cost - tokens) / self.rate
+
+            self.buckets[client] = (tokens - cost, now)
+            if len(self.buckets) > self.max_clients:
+                self._prune(now)
+            return 0
+
+    def refund(self, client, cost=1):
+        with self.lock:
+            if client in self.buckets:
+                tokens, updated = self.buckets[client]
+                self.buckets[client] = (min(self.burst, tokens + min(cost, self.burst)), updated)
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping.
+        full_after = self.burst / self.rate
+        for client, (_, updated) in list(self.buckets.items()):
+            if now - updated >= full_after:
+                del self.buckets[client]
+
+limiters = {
+    name: EndpointLimiter(settings['concurrency'], settings['queue'], settings['queue_timeout'])
+    for name, settings in ADMISSION_CONFIG['endpoints'].items()
+}
+rate_limits = TokenBuckets(ADMISSION_CONFIG['rate_per_second'], ADMISSION_CONFIG['burst'])
+
+for _name, _limiter in limiters.items():
+    metrics.register_gauge(f'admission_active_{_name}', lambda limiter=_limiter: limiter.active)
+    metrics.register_gauge(f'admission_waiting_{_name}', lambda limiter=_limiter: limiter.waiting)
+
+def client_id(request):
+    # The image routes do not authenticate AI-ID or access_id, so a client
+    # could pick a fresh one per request; buckets are keyed on the address.
+    return request.remote_addr
+
+def admission_control(endpoint, batch_size=None):
+    # Wraps a view with the endpoint's batch cap, the caller's token bucket
+    # (charged one token per item) and the endpoint's concurrency limit.
+    settings = ADMISSION_CONFIG['endpoints'][endpoint]
+    limiter = limiters[endpoint]
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import jsonify, request
+
+            if not ADMISSION_CONFIG['enabled']:
+                return view(*args, **kwargs)
+
+            items = batch_size(request) if batch_size else 1
+            if items > settings['max_batch']:
+                metrics.inc('admission_decisions', endpoint=endpoint, result='too_large')
+                return jsonify({'error': f"At most {settings['max_batch']} images per request"}), 400
+
+            client = client_id(request)
+            wait = rate_limits.take(client, max(items, 1))
+            if wait:
+                metrics.inc('admission_decisions', endpoint=endpoint, result='rate_limited')
+                return jsonify({'error': 'Rate limit exceeded'}), 429, {'Retry-After': str(math.ceil(wait))}
+
+            deadline = current_deadline()
+            if not limiter.acquire(deadline.remaining() if deadline else None):
+                rate_limits.refund(client, max(items, 1))
+                metrics.inc('admission_decisions', endpoint=endpoint, result='shed')
+                return jsonify({'error': 'Server busy, try again later'}), 429, {'Retry-After': str(ADMISSION_CONFIG['retry_after'])}
+
+            metrics.inc('admission_decisions', endpoint=endpoint, result='admitted')
+            try:
+                return view(*args, **kwargs)
+            finally:
+                limiter.release()
+        return wrapper
+    return decorator
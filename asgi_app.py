@@ -0,0 +1,331 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from catalog_tags import get_tag_index, parse_tag_query, search_catalog
+from config import ASYNC_CONFIG, DEADLINE_CONFIG, IMAGE_PROXY_CONFIG, PREFETCH_CONFIG, STORAGE_CONFIG, TAGGING_CONFIG
+from metrics import metrics
+from style_algorithm import (
+    authorize_preference,
+    apply_feedback,
+    check_batch_feedback,
+    check_batch_request,
+    check_feedback_request,
+    check_image_request,
+    image_stats_report,
+    issue_image_ticket,
+    parse_batch_count,
+    parse_profile_query,
+    parse_size_class,
+    pop_prefetched_ticket,
+    read_profile,
+    register_preference,
+    save_preferences,
+    serve_ticket,
+    store_prefetched_ticket,
+    store_profile,
+    style_aggregates,
+)
+from storage import create_catalog
+
+# Blocking S3 and CSV calls run here; request handling itself stays on the
+# event loop, so concurrency is bounded by this pool rather than by one
+# thread per open request.
+io_executor = ThreadPoolExecutor(max_workers=ASYNC_CONFIG['io_threads'], thread_name_prefix='quiz-io')
+
+async def run_io(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, func, *args)
+
+def create_asgi_app():
+    from quart import Quart, Response, jsonify, request
+
+    app = Quart(__name__)
+
+    @app.after_request
+    async def add_cors_headers(response):
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = f"Content-Type, Authorization, {DEADLINE_CONFIG['header']}"
+        return response
+
+    async def next_image_ticket(preference, iteration_id, available_images=None):
+        algorithm = preference['algorithm']
+        if available_images is None:
+            available_images = await run_io(algorithm.catalog.get_available_images, preference['gender'])
+        image_key, style = algorithm.select_next_image(preference['gender'], available_images)
+
+        if not image_key:
+            return None
+
+        url = await run_io(algorithm.catalog.get_image_url, image_key)
+        return issue_image_ticket(preference['preference_id'], iteration_id, image_key, style, url)
+
+    async def claim_image_ticket(preference, iteration_id, available_images=None):
+        prefetched = pop_prefetched_ticket(preference['preference_id'], iteration_id)
+        if prefetched is not None:
+            try:
+                ticket = await prefetched if isinstance(prefetched, asyncio.Task) else prefetched
+                if ticket:
+                    return ticket
+            except Exception as e:
+                print(f"Error using prefetched image: {e}")
+        return await next_image_ticket(preference, iteration_id, available_images)
+
+    async def next_image(preference_id, iteration_id, ai_id):
+        size_class, error = parse_size_class(request.args.get('size'))
+        if error:
+            return jsonify(error[0]), error[1]
+
+        preference, error = check_image_request(preference_id, iteration_id, ai_id)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        ticket = await claim_image_ticket(preference, iteration_id)
+        if not ticket:
+            return jsonify({'error': 'No more images available'}), 400
+
+        return jsonify(await run_io(serve_ticket, ticket, preference['algorithm'].catalog, size_class))
+
+    async def prefetch_next_image(preference, iteration_id, result, inline, size_class=None):
+        if iteration_id >= 30:
+            return
+        next_iteration = iteration_id + 1
+        if inline:
+            ticket = await next_image_ticket(preference, next_iteration)
+            store_prefetched_ticket(preference['preference_id'], next_iteration, ticket)
+            ticket = await run_io(serve_ticket, ticket, preference['algorithm'].catalog, size_class)
+            result['next_image'] = dict(ticket, iteration=next_iteration) if ticket else None
+        elif PREFETCH_CONFIG['speculative']:
+            task = asyncio.create_task(next_image_ticket(preference, next_iteration))
+            store_prefetched_ticket(preference['preference_id'], next_iteration, task)
+
+    async def submit_feedback(preference_id, iteration_id, ai_id, data):
+        preference, pending_image, error = check_feedback_request(preference_id, ai_id, data)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        result = apply_feedback(preference, data['image_id'], pending_image, data['feedback'], iteration_id)
+        await run_io(save_preferences)
+        await prefetch_next_image(preference, iteration_id, result, bool(data.get('prefetch')), data.get('size'))
+        return jsonify(result)
+
+    @app.route('/api')
+    async def health_check():
+        return jsonify({'status': 'ok'})
+
+    @app.route('/metrics', methods=['GET'])
+    async def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    if STORAGE_CONFIG['backend'] == 'local':
+        from quart import send_from_directory
+
+        @app.route(f"{STORAGE_CONFIG['local_route']}/<path:image_key>", methods=['GET'])
+        async def local_image(image_key):
+            return await send_from_directory(STORAGE_CONFIG['local_root'], image_key)
+
+    if IMAGE_PROXY_CONFIG['enabled']:
+        import mimetypes
+        from quart import send_file
+        from image_cache import get_image_cache, is_servable_key
+
+        image_cache = get_image_cache()
+        proxy_catalog = create_catalog(proxied=False)
+
+        @app.route(f"{IMAGE_PROXY_CONFIG['route']}/<path:image_key>", methods=['GET'])
+        async def proxy_image(image_key):
+            if not is_servable_key(image_key):
+                return jsonify({'error': 'Invalid image key'}), 404
+
+            for _ in range(2):
+                try:
+                    path, _, _ = await run_io(image_cache.get, image_key, proxy_catalog)
+                except Exception as e:
+                    print(f"Error fetching {image_key}: {e}")
+                    return jsonify({'error': 'Image not found'}), 404
+
+                try:
+                    response = await send_file(path, mimetype=mimetypes.guess_type(image_key)[0], conditional=True)
+                except FileNotFoundError:
+                    # Evicted between the lookup and opening it; look it up again.
+                    metrics.inc('image_cache_races')
+                    await run_io(image_cache.discard, image_key)
+                    continue
+                response.cache_control.public = True
+                response.cache_control.max_age = IMAGE_PROXY_CONFIG['max_age']
+                return response
+            return jsonify({'error': 'Image not found'}), 404
+
+    tag_catalog = create_catalog()
+
+    @app.route(TAGGING_CONFIG['route'], methods=['GET'])
+    async def search_tags():
+        index = await run_io(get_tag_index)
+        if index is None:
+            return jsonify({'error': 'Catalog has not been tagged'}), 404
+        filters, limit, error = parse_tag_query(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+        return jsonify(await run_io(search_catalog, index, filters, limit, tag_catalog))
+
+    @app.route('/api/stats/styles', methods=['GET'])
+    async def get_style_stats():
+        gender = request.args.get('gender')
+        if gender and gender not in ['men', 'women']:
+            return jsonify({'error': 'Invalid parameters'}), 400
+        return jsonify({'styles': style_aggregates.style_counts(gender)})
+
+    @app.route('/api/stats/images', methods=['GET'])
+    async def get_image_stats():
+        gender = request.args.get('gender')
+        if gender and gender not in ['men', 'women']:
+            return jsonify({'error': 'Invalid parameters'}), 400
+        try:
+            limit = int(request.args.get('limit', 50))
+        except ValueError:
+            return jsonify({'error': 'Invalid parameters'}), 400
+        return jsonify({'images': image_stats_report(gender, request.args.get('style'), limit)})
+
+    @app.route('/api/preference', methods=['POST'])
+    async def create_preference():
+        data = await request.get_json()
+        access_id = data.get('access_id')
+        gender = data.get('gender')
+
+        if not access_id or gender not in ['men', 'women']:
+            return jsonify({'error': 'Invalid parameters'}), 400
+
+        result = register_preference(access_id, gender, data.get('cohort'))
+        await run_io(save_preferences)
+        return jsonify(result)
+
+    @app.route('/api/preference/<preference_id>/iteration/1', methods=['GET'])
+    async def get_first_iteration(preference_id):
+        try:
+            return await next_image(preference_id, 1, request.headers.get('AI-ID'))
+        except Exception as e:
+            return jsonify({'error': f'Failed to get first image: {str(e)}'}), 400
+
+    @app.route('/api/preference/<preference_id>/iteration/1', methods=['POST'])
+    async def process_first_iteration(preference_id):
+        data = await request.get_json()
+        try:
+            return await submit_feedback(preference_id, 1, request.headers.get('AI-ID'), data)
+        except Exception as e:
+            return jsonify({'error': f'Failed to process first iteration: {str(e)}'}), 400
+
+    @app.route('/api/preference/<preference_id>/iteration/<int:iteration_id>', methods=['GET'])
+    async def get_iteration_image(preference_id, iteration_id):
+        if iteration_id == 1:
+            return jsonify({'error': 'Use /iteration/1 endpoint for first iteration'}), 400
+        if iteration_id < 2 or iteration_id > 30:
+            return jsonify({'error': 'Invalid iteration ID'}), 400
+
+        try:
+            return await next_image(preference_id, iteration_id, request.headers.get('AI-ID'))
+        except Exception as e:
+            return jsonify({'error': f'Failed to get next image: {str(e)}'}), 400
+
+    @app.route('/api/preference/<preference_id>/iteration/<int:iteration_id>', methods=['POST'])
+    async def process_iteration(preference_id, iteration_id):
+        if iteration_id == 1:
+            return jsonify({'error': 'Use /iteration/1 endpoint for first iteration'}), 400
+
+        data = await request.get_json()
+        try:
+            return await submit_feedback(preference_id, iteration_id, request.headers.get('AI-ID'), data)
+        except Exception as e:
+            return jsonify({'error': f'Failed to process iteration: {str(e)}'}), 400
+
+    @app.route('/api/preference/<preference_id>/batch', methods=['GET'])
+    async def get_image_batch(preference_id):
+        count, error = parse_batch_count(request.args.get('count'))
+        if error:
+            return jsonify(error[0]), error[1]
+
+        size_class, error = parse_size_class(request.args.get('size'))
+        if error:
+            return jsonify(error[0]), error[1]
+
+        try:
+            preference, iterations, error = check_batch_request(preference_id, request.headers.get('AI-ID'), count)
+            if error:
+                return jsonify(error[0]), error[1]
+
+            algorithm = preference['algorithm']
+            available_images = await run_io(algorithm.catalog.get_available_images, preference['gender'])
+            images = []
+            for iteration_id in iterations:
+                ticket = await claim_image_ticket(preference, iteration_id, available_images)
+                if not ticket:
+                    break
+                ticket = await run_io(serve_ticket, ticket, algorithm.catalog, size_class)
+                images.append(dict(ticket, iteration=iteration_id))
+
+            if not images:
+                return jsonify({'error': 'No more images available'}), 400
+
+            return jsonify({'images': images})
+        except Exception as e:
+            return jsonify({'error': f'Failed to get image batch: {str(e)}'}), 400
+
+    @app.route('/api/preference/<preference_id>/batch', methods=['POST'])
+    async def process_feedback_batch(preference_id):
+        data = await request.get_json()
+        try:
+            preference, items, error = check_batch_feedback(preference_id, request.headers.get('AI-ID'), data)
+            if error:
+                return jsonify(error[0]), error[1]
+
+            for image_id, pending_image, feedback in items:
+                result = apply_feedback(preference, image_id, pending_image, feedback, pending_image['iteration'])
+            await run_io(save_preferences)
+            await prefetch_next_image(preference, result['iteration'], result, bool(data.get('prefetch')), data.get('size'))
+            result['applied'] = len(items)
+            return jsonify(result)
+        except Exception as e:
+            return jsonify({'error': f'Failed to process feedback batch: {str(e)}'}), 400
+
+    @app.route('/api/preference/<preference_id>/profile', methods=['POST'])
+    async def save_profile(preference_id):
+        preference, error = authorize_preference(preference_id, request.headers.get('AI-ID'))
+        if error:
+            return jsonify(error[0]), error[1]
+
+        if not preference['completed']:
+            return jsonify({'error': 'Profile not completed'}), 400
+
+        await run_io(store_profile, preference_id, preference['algorithm'])
+        return jsonify({'message': 'Profile saved successfully'})
+
+    @app.route('/api/preference/<preference_id>/profile', methods=['GET'])
+    async def get_profile(preference_id):
+        try:
+            preference, error = authorize_preference(preference_id, request.headers.get('AI-ID'))
+            if error:
+                return jsonify(error[0]), error[1]
+
+            query, error = parse_profile_query(request.args)
+            if error:
+                return jsonify(error[0]), error[1]
+
+            body, status, etag = await run_io(read_profile, preference_id, query, request.headers.get('If-None-Match'))
+            headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'} if etag else {}
+            if status == 304:
+                return '', 304, headers
+            return jsonify(body), status, headers
+        except Exception as e:
+            return jsonify({'error': f'Failed to retrieve profile: {str(e)}'}), 400
+
+    return app
+
+if __name__ == "__main__":
+    app = create_asgi_app()
+    try:
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+    except ImportError:
+        app.run(host='0.0.0.0', port=ASYNC_CONFIG['port'])
+    else:
+        hypercorn_config = Config()
+        hypercorn_config.bind = [f"0.0.0.0:{ASYNC_CONFIG['port']}"]
+        asyncio.run(serve(app, hypercorn_config))
@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STYLES = ['classic', 'creative', 'fashionista', 'modern', 'sophisticated', 'street']
+
+class StubStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def record(self, prompt_tokens, completion_tokens):
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+def fake_predictions(rng):
+    return [{
+        'label': rng.choice(['shirt', 'dress', 'jacket', 'trousers']),
+        'score': round(rng.uniform(0.5, 1.0), 2),
+        'pattern': rng.choice(['plain', 'striped', 'checked']),
+        'color': rng.choice(['black', 'navy', 'white', 'olive']),
+        'material': rng.choice(['cotton', 'denim', 'wool'])
+    } for _ in range(2)]
+
+def sample_image(width, height):
+    # A full-resolution catalog-style photo for the stub to serve.
+    from io import BytesIO
+    from PIL import Image
+
+    image = Image.effect_noise((width // 8, height // 8), 48).convert('RGB').resize((width, height), Image.BICUBIC)
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+def make_stub_handler(stats, args, image_data):
+    # Answers chat completions like the real API would for our two prompts:
+    # a fixed per-call latency plus per-image and per-output-token time, with
+    # prompt tokens estimated at 4 characters each plus a flat cost per image.
+    # Images passed by URL also cost the provider a fetch, and only
+    # low-detail images get the flat low-detail token price.
+    rng = random.Random(0)
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(image_data)))
+            self.end_headers()
+            self.wfile.write(image_data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            parts = body['messages'][0]['content']
+            texts = [part['text'] for part in parts if part['type'] == 'text']
+            image_parts = [part['image_url'] for part in parts if part['type'] == 'image_url']
+            images = len(image_parts)
+            fetched = sum(1 for part in image_parts if not part['url'].startswith('data:'))
+            image_tokens = sum(85 if part.get('detail') == 'low' else args.image_tokens for part in image_parts)
+
+            marker = next((text for text in texts if '"version": "' in text), None)
+            if marker:
+                version = marker.split('"version": "')[1].split('"')[0]
+                results = [{'index': i, 'predictions': fake_predictions(rng)} for i in range(images)]
+                if rng.random() < args.malformed_rate:
+                    results = results[:-1] if rng.random() < 0.5 else 'not a list'
+                content = json.dumps({'version': version, 'results': results})
+            else:
+                content = json.dumps({'predictions': fake_predictions(rng)})
+
+            prompt_tokens = sum(len(text) for text in texts) // 4 + image_tokens
+            completion_tokens = len(content) // 4
+            stats.record(prompt_tokens, completion_tokens)
+            time.sleep((args.call_ms + images * args.image_ms + fetched * args.fetch_ms + completion_tokens * args.token_ms) / 1000)
+
+            payload = json.dumps({
+                'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': body['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens}
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokens and wall time per image for batched classification against a local stub")
+    parser.add_argument('--images', type=int, default=24)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(range(1, 9)))
+    parser.add_argument('--call-ms', type=float, default=600, help="Stub latency per chat completion")
+    parser.add_argument('--image-ms', type=float, default=100, help="Stub latency per image in a call")
+    parser.add_argument('--token-ms', type=float, default=10, help="Stub latency per output token")
+    parser.add_argument('--fetch-ms', type=float, default=400, help="Stub latency for fetching an image passed by URL")
+    parser.add_argument('--image-tokens', type=int, default=1105, help="Prompt tokens charged per image that is not low detail")
+    parser.add_argument('--modes', nargs='+', choices=['url', 'inline'], default=['url', 'inline'],
+                        help="Send images by URL, or downscaled inline as data URLs")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="Share of batch responses that are malformed")
+    args = parser.parse_args()
+
+    stats = StubStats()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_stub_handler(stats, args, sample_image(1600, 2000)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault('OPENAI_API_KEY', 'stub')
+
+    import image_analysis
+    import inline_images
+    from config import ANALYSIS_CONFIG
+    from deadlines import Deadline
+
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    image_urls = [f"{base_url}/Styles/women/{STYLES[i % len(STYLES)]}-style/img{i}.jpg" for i in range(args.images)]
+
+    print(f"{'mode':>7} {'batch':>6} {'calls':>6} {'prompt tok/img':>15} {'output tok/img':>15} {'wall s':>8} {'ms/img':>8} {'errors':>7}")
+    print('-' * 78)
+    for mode in args.modes:
+        ANALYSIS_CONFIG['inline_images'] = mode == 'inline'
+        for batch_size in args.batch_sizes:
+            ANALYSIS_CONFIG['batching'] = True
+            ANALYSIS_CONFIG['batch_size'] = batch_size
+            # Every run starts cold; repeat requests would hit the payload cache.
+            inline_images.payload_cache.entries.clear()
+            stats.reset()
+            start = time.perf_counter()
+            results, _ = image_analysis.analyze_until_deadline(image_urls, Deadline(600))
+            elapsed = time.perf_counter() - start
+            errors = sum(1 for result in results if 'error' in result)
+            print(f"{mode:>7} {batch_size:>6} {stats.calls:>6} {stats.prompt_tokens / args.images:>15.0f} "
+                  f"{stats.completion_tokens / args.images:>15.0f} {elapsed:>8.2f} {elapsed * 1000 / args.images:>8.0f} {errors:>7}")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
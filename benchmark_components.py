@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import timeit
+from config import ALGORITHM_PARAMS
+from components.score_manager import ScoreManager
+from components.image_selector import ImageSelector
+from components.results_manager import ResultsManager
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_thresholds.json')
+
+STYLE_COUNTS = [6, 50, 200, 1000]
+IMAGES_PER_STYLE = [10, 1000, 10000, 100000]
+
+# select_image only looks at one style, so the catalog width is kept small
+# while the style depth is swept.
+SELECT_IMAGE_STYLE_COUNT = 6
+# A 30-iteration quiz never shows more than 30 images.
+SHOWN_IMAGES = 29
+
+# Measured timings are multiplied by this when thresholds are regenerated,
+# so slower machines do not trip the check on noise alone.
+THRESHOLD_HEADROOM = 3.0
+
+
+def build_catalog(style_count, images_per_style):
+    return {
+        f"style{s}": [f"Styles/women/style{s}-style/img{i}.jpg" for i in range(images_per_style)]
+        for s in range(style_count)
+    }
+
+
+def build_score_manager(styles):
+    score_manager = ScoreManager(ALGORITHM_PARAMS)
+    now = time.time()
+    for idx, style in enumerate(styles):
+        score_manager.style_scores[style] = random.uniform(-2.0, 4.0)
+        score_manager.style_interaction_count[style] = idx % 5
+        score_manager.style_last_shown[style] = now - random.uniform(0, 7200)
+    return score_manager
+
+
+def bench_update_scores(style_count):
+    catalog = build_catalog(style_count, 1)
+    styles = list(catalog)
+    score_manager = build_score_manager(styles)
+    feedback = ['like', 'dislike']
+    counter = [0]
+
+    def run():
+        counter[0] += 1
+        score_manager.update_scores(styles[counter[0] % style_count], feedback[counter[0] & 1])
+    return run
+
+
+def bench_calculate_exploration_scores(style_count):
+    catalog = build_catalog(style_count, 1)
+    score_manager = build_score_manager(list(catalog))
+    selector = ImageSelector(ALGORITHM_PARAMS)
+
+    def run():
+        selector.calculate_exploration_scores(
+            catalog,
+            score_manager.style_scores,
+            score_manager.style_interaction_count,
+            score_manager.style_last_shown
+        )
+    return run
+
+
+def bench_select_style(style_count):
+    catalog = build_catalog(style_count, 1)
+    score_manager = build_score_manager(list(catalog))
+    selector = ImageSelector(ALGORITHM_PARAMS)
+    exploration_scores, _ = selector.calculate_exploration_scores(
+        catalog,
+        score_manager.style_scores,
+        score_manager.style_interaction_count,
+        score_manager.style_last_shown
+    )
+
+    def run():
+        selector.select_style(exploration_scores, catalog)
+    return run
+
+
+def bench_select_image(images_per_style):
+    catalog = build_catalog(SELECT_IMAGE_STYLE_COUNT, images_per_style)
+    style = next(iter(catalog))
+    selector = ImageSelector(ALGORITHM_PARAMS)
+    shown = min(SHOWN_IMAGES, images_per_style - 1)
+    selector.shown_images.update(catalog[style][:shown])
+
+    def run():
+        selected = selector.select_image(catalog, style)
+        selector.shown_images.discard(selected)
+    return run
+
+
+def bench_normalize_scores(style_count):
+    catalog = build_catalog(style_count, 1)
+    score_manager = build_score_manager(list(catalog))
+    results_manager = ResultsManager()
+
+    def run():
+        results_manager.normalize_scores(score_manager.style_scores)
+    return run
+
+
+BENCHMARKS = [
+    ('ScoreManager.update_scores', 'styles', STYLE_COUNTS, bench_update_scores),
+    ('ImageSelector.calculate_exploration_scores', 'styles', STYLE_COUNTS, bench_calculate_exploration_scores),
+    ('ImageSelector.select_style', 'styles', STYLE_COUNTS, bench_select_style),
+    ('ImageSelector.select_image', 'images_per_style', IMAGES_PER_STYLE, bench_select_image),
+    ('ResultsManager.normalize_scores', 'styles', STYLE_COUNTS, bench_normalize_scores),
+]
+
+
+def measure(func, repeat=5, min_time=0.2):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1e6
+
+
+def run_benchmarks(selected=None):
+    results = {}
+    for name, param_name, values, factory in BENCHMARKS:
+        if selected and not any(s in name for s in selected):
+            continue
+        for value in values:
+            random.seed(0)
+            key = f"{name}[{param_name}={value}]"
+            results[key] = measure(factory(value))
+            print(f"{key:<65} {results[key]:>12.2f} us/call")
+    return results
+
+
+def load_thresholds():
+    if not os.path.exists(THRESHOLDS_FILE):
+        return {}
+    with open(THRESHOLDS_FILE) as f:
+        return json.load(f)
+
+
+def check_thresholds(results, thresholds):
+    regressions = []
+    for key, elapsed in results.items():
+        limit = thresholds.get(key)
+        if limit is not None and elapsed > limit:
+            regressions.append((key, elapsed, limit))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the scoring components")
+    parser.add_argument('--only', nargs='*', help="Only run benchmarks whose name contains one of these strings")
+    parser.add_argument('--update-thresholds', action='store_true',
+                        help=f"Rewrite {os.path.basename(THRESHOLDS_FILE)} from this run")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only)
+
+    if args.update_thresholds:
+        thresholds = load_thresholds()
+        thresholds.update({
+            key: round(elapsed * THRESHOLD_HEADROOM, 2)
+            for key, elapsed in results.items()
+        })
+        with open(THRESHOLDS_FILE, 'w') as f:
+            json.dump(dict(sorted(thresholds.items())), f, indent=2)
+            f.write('\n')
+        print(f"\nThresholds written to {THRESHOLDS_FILE}")
+        return 0
+
+    regressions = check_thresholds(results, load_thresholds())
+    if regressions:
+        print("\nRegressions:")
+        print("-" * 80)
+        for key, elapsed, limit in regressions:
+            print(f"{key}: {elapsed:.2f} us/call (threshold {limit:.2f})")
+        return 1
+
+    print("\nAll benchmarks within thresholds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import argparse
+import base64
+import gzip
+import io
+import os
+import random
+import timeit
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from config import RESPONSE_CONFIG
+from response_encoding import load_brotli, load_orjson, make_json_provider_class
+
+STYLES = ['classic', 'creative', 'fashionista', 'modern', 'sophisticated', 'street']
+
+def profile_payload(iterations):
+    rng = random.Random(iterations)
+    return {
+        'top_styles': {'modern': 10.0, 'classic': 7.4},
+        'selection_history': [{
+            'image': f"Styles/women/{style}-style/img{rng.randint(1, 400)}.jpg",
+            'style': style,
+            'feedback': rng.choice(['Like', 'Dislike']),
+            'score_change': rng.uniform(-1.5, 1.5),
+            'current_score': rng.uniform(-5, 5),
+            'timestamp': 1790000000 + i * 3.7
+        } for i, style in ((i, rng.choice(STYLES)) for i in range(iterations))]
+    }
+
+def analysis_payload(count):
+    rng = random.Random(count)
+    return {'results': [{
+        'image_url': f"https://ethos-style-images.s3.amazonaws.com/Styles/men/street-style/img{i}.jpg",
+        'analysis': {
+            'image_type': 'clothing',
+            'items': [{
+                'type': rng.choice(['shirt', 'jacket', 'trousers', 'sneakers']),
+                'pattern': rng.choice(['plain', 'striped', 'checked']),
+                'color': rng.choice(['black', 'navy', 'white', 'olive']),
+                'fabric': rng.choice(['cotton', 'denim', 'wool']),
+                'style': rng.choice(STYLES)
+            } for _ in range(4)]
+        }
+    } for i in range(count)]}
+
+def base64_payload(size):
+    # A cut-out PNG like /remove-background returns; PIL is optional here.
+    try:
+        from PIL import Image
+        image = Image.new('RGBA', (size, size))
+        image.putdata([(x % 256, y % 256, (x * y) % 256, 255 if (x - size / 2) ** 2 + (y - size / 2) ** 2 < (size / 3) ** 2 else 0)
+                       for y in range(size) for x in range(size)])
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        data = buffer.getvalue()
+    except ImportError:
+        data = os.urandom(size * size // 2)
+    return {'results': [{'original_url': 'https://example.com/shirt.jpg', 'image_base64': base64.b64encode(data).decode()}]}
+
+PAYLOADS = [
+    ('profile, 30 iterations', lambda: profile_payload(30)),
+    ('profile, 300 iterations', lambda: profile_payload(300)),
+    ('analyze-images, 10 results', lambda: analysis_payload(10)),
+    ('analyze-images, 50 results', lambda: analysis_payload(50)),
+    ('remove-background base64, 256px', lambda: base64_payload(256)),
+]
+
+def measure(func, repeat=5):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes on the wire and serialization CPU for API responses")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    orjson = load_orjson()
+    brotli = load_brotli()
+
+    app = Flask(__name__)
+    providers = [('json', DefaultJSONProvider(app))]
+    if orjson:
+        providers.append(('orjson', make_json_provider_class(orjson)(app)))
+    else:
+        print("orjson is not installed; only the default provider is measured")
+    if not brotli:
+        print("brotli is not installed; br columns are skipped")
+
+    print(f"\n{'payload':<34} {'encoder':<8} {'serialize us':>13} {'raw B':>9} {'gzip B':>9} {'gzip us':>9} {'br B':>9} {'br us':>9}")
+    print('-' * 106)
+    with app.app_context():
+        for name, build in PAYLOADS:
+            payload = build()
+            for label, provider in providers:
+                serialize_us = measure(lambda: provider.response(payload).get_data(), args.repeat)
+                data = provider.response(payload).get_data()
+
+                gzip_level = RESPONSE_CONFIG['gzip_level']
+                gzipped = gzip.compress(data, compresslevel=gzip_level, mtime=0)
+                gzip_us = measure(lambda: gzip.compress(data, compresslevel=gzip_level, mtime=0), args.repeat)
+
+                br_bytes = br_us = '-'
+                if brotli:
+                    quality = RESPONSE_CONFIG['brotli_quality']
+                    br_bytes = len(brotli.compress(data, quality=quality))
+                    br_us = f"{measure(lambda: brotli.compress(data, quality=quality), args.repeat):.1f}"
+
+                print(f"{name:<34} {label:<8} {serialize_us:>13.1f} {len(data):>9} {len(gzipped):>9} {gzip_us:>9.1f} {br_bytes:>9} {br_us:>9}")
+
+if __name__ == "__main__":
+    main()
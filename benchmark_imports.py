@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Modules that quiz workers must not load at import time.
+HEAVY_MODULES = ['rembg', 'onnxruntime', 'PIL', 'openai', 'transformers', 'torch']
+
+DEFAULT_TARGETS = ['style_algorithm', 'image_analysis', 'test']
+
+CHILD_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'seconds': elapsed,
+    'max_rss_mb': rss_kb / 1024,
+    'loaded': [m for m in {heavy!r} if m in sys.modules]
+}}))
+"""
+
+
+def measure_import(module, repeat=3):
+    runs = []
+    for _ in range(repeat):
+        # A fresh interpreter per run so nothing is already in sys.modules.
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True
+        )
+        if output.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{output.stderr}")
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda r: r['seconds'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark for the API modules")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_TARGETS)
+    parser.add_argument('--budget', type=float, default=1.0, help="Maximum import time in seconds")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<20} {'seconds':>8} {'max rss (MB)':>13}  heavy modules loaded")
+    print("-" * 80)
+    for module in args.modules:
+        result = measure_import(module)
+        print(f"{module:<20} {result['seconds']:>8.3f} {result['max_rss_mb']:>13.1f}  {', '.join(result['loaded']) or '-'}")
+        if result['seconds'] > args.budget:
+            failures.append(f"{module} took {result['seconds']:.3f}s (budget {args.budget:.3f}s)")
+        if result['loaded']:
+            failures.append(f"{module} imported {', '.join(result['loaded'])}")
+
+    if failures:
+        print("\nFailures:")
+        for failure in failures:
+            print(f"- {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+def run_session(base_url, gender, latencies, errors):
+    session = requests.Session()
+
+    def call(method, path, **kwargs):
+        start = time.perf_counter()
+        response = session.request(method, f"{base_url}{path}", **kwargs)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(f"{method} {path}: {response.status_code} {response.text[:200]}")
+            return None
+        return response.json()
+
+    created = call('POST', '/preference', json={'access_id': 'loadtest', 'gender': gender})
+    if not created:
+        return
+    preference_id = created['preference_id']
+    headers = {'AI-ID': created['ai_id']}
+
+    for iteration in range(1, 31):
+        image = call('GET', f"/preference/{preference_id}/iteration/{iteration}", headers=headers)
+        if not image:
+            return
+        feedback = {'feedback': 'like' if iteration % 2 == 0 else 'dislike', 'image_id': image['image_id']}
+        if not call('POST', f"/preference/{preference_id}/iteration/{iteration}", headers=headers, json=feedback):
+            return
+
+def run_load(base_url, sessions, concurrency, gender):
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(sessions):
+            executor.submit(run_session, base_url, gender, latencies, errors)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load comparison of the quiz API serving modes")
+    parser.add_argument('--sync-url', default='http://localhost:5020/api', help="Flask (WSGI) server base URL")
+    parser.add_argument('--async-url', default='http://localhost:5022/api', help="ASGI server base URL")
+    parser.add_argument('--sessions', type=int, default=100, help="Quiz sessions to run per mode")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--gender', default='women', choices=['men', 'women'])
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'conc':>5} {'reqs':>6} {'errs':>5} {'req/s':>8} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    print("-" * 76)
+    for concurrency in args.concurrency:
+        for mode, url in (('sync', args.sync_url), ('async', args.async_url)):
+            if not url:
+                continue
+            result = run_load(url, args.sessions, concurrency, args.gender)
+            print(f"{mode:<6} {concurrency:>5} {result['requests']:>6} {result['errors']:>5} "
+                  f"{result['throughput']:>8.1f} {result['mean_ms']:>8.1f} {result['p50_ms']:>8.1f} "
+                  f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+            if result['first_error']:
+                print(f"       first error: {result['first_error']}")
+
+if __name__ == "__main__":
+    main()
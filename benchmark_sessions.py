@@ -0,0 +1,163 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the stress run away from the real per-image stats and priors.
+os.environ.setdefault('IMAGE_STATS_ENABLED', 'false')
+os.environ.setdefault('PRIORS_ENABLED', 'false')
+os.environ.setdefault('IMAGE_PROXY_ENABLED', 'false')
+
+import style_algorithm
+from components.style_aggregates import StyleAggregates
+from config import AGGREGATES_CONFIG
+from storage import CatalogBackend
+
+STYLES = ['classic', 'creative', 'fashionista', 'modern', 'sophisticated', 'street', 'boho']
+
+class SimulatedCatalog(CatalogBackend):
+    # Stands in for S3 with a fixed listing latency, so the run measures the
+    # quiz service's own locking rather than the network.
+    latency = 0.0
+
+    def get_available_images(self, gender):
+        time.sleep(self.latency)
+        return defaultdict(list, {
+            style: [f"Styles/{gender}/{style}-style/img{i}.jpg" for i in range(40)]
+            for style in STYLES
+        })
+
+    def get_image_url(self, image_key):
+        return f"https://example.com/{image_key}"
+
+    # The stress run only lists and signs images; there are no objects.
+    def read_object(self, key):
+        raise FileNotFoundError(key)
+
+    def write_object(self, key, data, content_type):
+        raise NotImplementedError("SimulatedCatalog is read-only")
+
+    def download_object(self, key, path):
+        raise FileNotFoundError(key)
+
+    def object_version(self, key):
+        raise FileNotFoundError(key)
+
+def run_session(client, errors):
+    created = client.post('/api/preference', json={'access_id': 'stress', 'gender': 'women'}).get_json()
+    preference_id = created['preference_id']
+    headers = {'AI-ID': created['ai_id']}
+    requests = 1
+
+    for iteration in range(1, 31):
+        image = client.get(f"/api/preference/{preference_id}/iteration/{iteration}", headers=headers)
+        feedback = {'feedback': 'like' if iteration % 2 else 'dislike', 'image_id': image.get_json().get('image_id')}
+        result = client.post(f"/api/preference/{preference_id}/iteration/{iteration}", headers=headers, json=feedback)
+        requests += 2
+        if image.status_code != 200 or result.status_code != 200:
+            errors.append(f"{preference_id} iteration {iteration}: {image.status_code}/{result.status_code} {result.get_json()}")
+            break
+    return preference_id, requests
+
+def check_sessions(preference_ids):
+    problems = []
+    for preference_id in preference_ids:
+        session = style_algorithm.sessions.get(preference_id)
+        selections = len(session['algorithm'].get_selection_history())
+        if session['current_iteration'] != 30 or selections != 30 or session['completed'] is not True:
+            problems.append(f"{preference_id}: iteration {session['current_iteration']}, {selections} selections")
+    return problems
+
+def run_load(app, sessions, threads):
+    errors = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(run_session, app.test_client(), errors) for _ in range(sessions)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    requests = sum(count for _, count in results)
+    problems = errors + check_sessions(preference_id for preference_id, _ in results)
+    return requests / elapsed, problems
+
+def run_duplicate_race(app, attempts, senders):
+    # The same feedback POSTed by several threads at once must be applied
+    # exactly once.
+    problems = []
+    for _ in range(attempts):
+        client = app.test_client()
+        created = client.post('/api/preference', json={'access_id': 'stress', 'gender': 'men'}).get_json()
+        preference_id = created['preference_id']
+        headers = {'AI-ID': created['ai_id']}
+        image = client.get(f"/api/preference/{preference_id}/iteration/1", headers=headers).get_json()
+
+        barrier = threading.Barrier(senders)
+        statuses = []
+
+        def send():
+            sender = app.test_client()
+            barrier.wait()
+            response = sender.post(f"/api/preference/{preference_id}/iteration/1", headers=headers,
+                                   json={'feedback': 'like', 'image_id': image['image_id']})
+            statuses.append(response.status_code)
+
+        workers = [threading.Thread(target=send) for _ in range(senders)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        session = style_algorithm.sessions.get(preference_id)
+        applied = len(session['algorithm'].get_selection_history())
+        if statuses.count(200) != 1 or applied != 1 or session['current_iteration'] != 1:
+            problems.append(f"{preference_id}: statuses {sorted(statuses)}, {applied} selections applied")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency stress test for quiz session locking")
+    parser.add_argument('--sessions', type=int, default=64)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Simulated catalog listing latency")
+    parser.add_argument('--race-attempts', type=int, default=20)
+    parser.add_argument('--min-speedup', type=float, default=0.0,
+                        help="Fail if throughput at the highest thread count is below this multiple of one thread")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ethos-stress-')
+    style_algorithm.PREFERENCES_CSV = os.path.join(workdir, 'preferences.csv')
+    style_algorithm.AGGREGATES_JSON = os.path.join(workdir, 'style_aggregates.json')
+    style_algorithm.style_aggregates = StyleAggregates()
+    style_algorithm.style_aggregates.start_autosave(style_algorithm.AGGREGATES_JSON, AGGREGATES_CONFIG['flush_every'], AGGREGATES_CONFIG['flush_seconds'])
+    style_algorithm.create_catalog = SimulatedCatalog
+    SimulatedCatalog.latency = args.latency_ms / 1000
+    app = style_algorithm.create_app(services=('quiz',))
+
+    print(f"{'threads':>8} {'req/s':>10} {'speedup':>8}")
+    print('-' * 28)
+    problems = []
+    baseline = throughput = None
+    for threads in args.threads:
+        throughput, run_problems = run_load(app, args.sessions, threads)
+        baseline = baseline or throughput
+        problems.extend(run_problems)
+        print(f"{threads:>8} {throughput:>10.1f} {throughput / baseline:>7.2f}x")
+
+    problems.extend(run_duplicate_race(app, args.race_attempts, senders=8))
+
+    if problems:
+        print(f"\n{len(problems)} consistency problems:")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"\nAll sessions consistent; duplicate feedback applied once in {args.race_attempts} races")
+
+    if args.min_speedup and throughput / baseline < args.min_speedup:
+        print(f"Speedup {throughput / baseline:.2f}x is below {args.min_speedup:.2f}x")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import argparse
+from config import PRIORS_CONFIG
+from components.style_priors import StylePriors
+from style_algorithm import AGGREGATES_JSON, PRIORS_JSON, style_aggregates
+
+def main():
+    parser = argparse.ArgumentParser(description="Build warm-start priors from the style aggregates")
+    parser.add_argument('--output', default=PRIORS_JSON)
+    parser.add_argument('--strength', type=float, default=PRIORS_CONFIG['strength'])
+    parser.add_argument('--min-events', type=int, default=PRIORS_CONFIG['min_events'])
+    parser.add_argument('--top-images', type=int, default=PRIORS_CONFIG['top_images'])
+    args = parser.parse_args()
+
+    priors = StylePriors.from_aggregates(
+        style_aggregates,
+        strength=args.strength,
+        min_events=args.min_events,
+        top_images=args.top_images
+    )
+    if not priors.cohorts:
+        print(f"No feedback recorded in {AGGREGATES_JSON}; nothing to build")
+        return
+
+    priors.save(args.output)
+    print(f"Priors written to {args.output}")
+    for gender, by_cohort in priors.cohorts.items():
+        for cohort, prior in by_cohort.items():
+            top = sorted(prior['style_scores'].items(), key=lambda x: x[1], reverse=True)[:3]
+            print(f"{gender}/{cohort}: " + ", ".join(f"{style} {score:+.2f}" for style, score in top))
+
+if __name__ == "__main__":
+    main()
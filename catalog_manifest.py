@@ -0,0 +1,221 @@
+import argparse
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from metrics import metrics
+from sqlite_store import SQLiteStore, open_shared
+
+class CatalogManifest(SQLiteStore):
+    def __init__(self, db_path, refresh_seconds=30):
+        super().__init__(db_path)
+        self.refresh_seconds = refresh_seconds
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS objects (
+                    key TEXT PRIMARY KEY,
+                    prefix TEXT NOT NULL,
+                    gender TEXT NOT NULL,
+                    style TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT NOT NULL,
+                    last_modified TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS objects_gender_style ON objects (gender, style)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def generation(self):
+        row = self._connection().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def bump_generation(self):
+        with self._connection() as conn:
+            conn.execute("""
+                INSERT INTO meta (name, value) VALUES ('generation', '1')
+                ON CONFLICT(name) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """)
+
+    def sync_prefix(self, prefix, gender, style, objects):
+        # Only rows whose size/ETag/LastModified changed are written, and
+        # keys no longer listed under the prefix are dropped.
+        conn = self._connection()
+        existing = {
+            key: (size, etag, last_modified)
+            for key, size, etag, last_modified in conn.execute(
+                "SELECT key, size, etag, last_modified FROM objects WHERE prefix = ?", (prefix,)
+            )
+        }
+
+        now = time.time()
+        upserts = []
+        added = changed = 0
+        for obj in objects:
+            current = existing.pop(obj['key'], None)
+            record = (obj['size'], obj['etag'], obj['last_modified'])
+            if current == record:
+                continue
+            if current is None:
+                added += 1
+            else:
+                changed += 1
+            upserts.append((obj['key'], prefix, gender, style, *record, now))
+
+        with conn:
+            conn.executemany("""
+                INSERT INTO objects (key, prefix, gender, style, size, etag, last_modified, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    prefix = excluded.prefix,
+                    gender = excluded.gender,
+                    style = excluded.style,
+                    size = excluded.size,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    updated_at = excluded.updated_at
+            """, upserts)
+            conn.executemany("DELETE FROM objects WHERE key = ?", [(key,) for key in existing])
+
+        return added, changed, len(existing)
+
+    def remove_prefixes_except(self, prefixes):
+        conn = self._connection()
+        stale = [row[0] for row in conn.execute("SELECT DISTINCT prefix FROM objects") if row[0] not in prefixes]
+        with conn:
+            conn.executemany("DELETE FROM objects WHERE prefix = ?", [(prefix,) for prefix in stale])
+        return stale
+
+    def counts(self):
+        return self._connection().execute(
+            "SELECT gender, style, COUNT(*), SUM(size) FROM objects GROUP BY gender, style ORDER BY gender, style"
+        ).fetchall()
+
+    def images_by_style(self, gender):
+        # Cached per gender and re-read only when an inventory run has bumped
+        # the generation, checked at most every refresh_seconds.
+        now = time.monotonic()
+        with self.cache_lock:
+            cached = self.cache.get(gender)
+        if cached and now - cached['checked_at'] < self.refresh_seconds:
+            metrics.inc('catalog_lookups', result='hit')
+            return cached['images']
+
+        generation = self.generation()
+        if cached and cached['generation'] == generation:
+            cached['checked_at'] = now
+            metrics.inc('catalog_lookups', result='hit')
+            return cached['images']
+
+        metrics.inc('catalog_lookups', result='miss')
+        images = defaultdict(list)
+        for style, key in self._connection().execute(
+            "SELECT style, key FROM objects WHERE gender = ? ORDER BY key", (gender,)
+        ):
+            images[style].append(key)
+
+        with self.cache_lock:
+            self.cache[gender] = {'generation': generation, 'checked_at': now, 'images': dict(images)}
+        return dict(images)
+
+def open_manifest(db_path, refresh_seconds=30):
+    # One shared manifest (and catalog cache) per process; S3Handler is
+    # created per session.
+    return open_shared(CatalogManifest, db_path, refresh_seconds)
+
+def list_common_prefixes(s3_client, bucket, prefix):
+    prefixes = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        metrics.inc('s3_calls', operation='list_objects_v2')
+        prefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+    return prefixes
+
+def list_objects(s3_client, bucket, prefix):
+    objects = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        metrics.inc('s3_calls', operation='list_objects_v2')
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('/'):
+                continue
+            objects.append({
+                'key': obj['Key'],
+                'size': obj['Size'],
+                'etag': obj['ETag'].strip('"'),
+                'last_modified': obj['LastModified'].isoformat()
+            })
+    return objects
+
+def run_inventory(manifest, s3_client, bucket, root_prefix, genders=None, workers=16):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        gender_prefixes = [
+            p for p in list_common_prefixes(s3_client, bucket, root_prefix)
+            if not genders or p[len(root_prefix):].rstrip('/') in genders
+        ]
+        style_prefixes = []
+        for prefixes in executor.map(lambda p: list_common_prefixes(s3_client, bucket, p), gender_prefixes):
+            style_prefixes.extend(prefixes)
+
+        futures = {executor.submit(list_objects, s3_client, bucket, prefix): prefix for prefix in style_prefixes}
+        totals = {'prefixes': len(style_prefixes), 'objects': 0, 'added': 0, 'changed': 0, 'removed': 0, 'errors': 0}
+        for future in as_completed(futures):
+            prefix = futures[future]
+            try:
+                objects = future.result()
+            except Exception as e:
+                # Leave the prefix's rows alone rather than treating a failed
+                # listing as empty.
+                totals['errors'] += 1
+                print(f"Error listing {prefix}: {e}")
+                continue
+
+            gender, style = prefix[len(root_prefix):].rstrip('/').split('/', 1)
+            added, changed, removed = manifest.sync_prefix(prefix, gender, style.replace('-style', ''), objects)
+            totals['objects'] += len(objects)
+            totals['added'] += added
+            totals['changed'] += changed
+            totals['removed'] += removed
+
+    if not genders and not totals['errors']:
+        for prefix in manifest.remove_prefixes_except(set(style_prefixes)):
+            print(f"Removed vanished prefix {prefix}")
+            totals['removed'] += 1
+
+    if totals['added'] or totals['changed'] or totals['removed']:
+        manifest.bump_generation()
+    return totals
+
+def main():
+    from config import S3_CONFIG
+    from s3_handler import S3Handler
+
+    parser = argparse.ArgumentParser(description="S3 catalog inventory")
+    parser.add_argument('command', choices=['inventory', 'counts'])
+    parser.add_argument('--manifest', default=S3_CONFIG['catalog_manifest'])
+    parser.add_argument('--gender', action='append', help="Limit the run to these genders")
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    manifest = CatalogManifest(args.manifest)
+    if args.command == 'inventory':
+        handler = S3Handler()
+        start = time.perf_counter()
+        totals = run_inventory(manifest, handler.s3_client, handler.bucket_name, handler.prefix, args.gender, args.workers)
+        print(f"Listed {totals['objects']} objects under {totals['prefixes']} prefixes in {time.perf_counter() - start:.1f}s")
+        print(f"added {totals['added']}, changed {totals['changed']}, removed {totals['removed']}, errors {totals['errors']}")
+
+    total = 0
+    print("\nFile counts by category:")
+    print("-" * 40)
+    for gender, style, count, size in manifest.counts():
+        print(f"{gender}/{style}: {count} files ({size / 1e6:.1f} MB)")
+        total += count
+    print("-" * 40)
+    print(f"Total files: {total}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import ANALYSIS_CONFIG, TAGGING_CONFIG
+from metrics import metrics
+from sqlite_store import SQLiteStore, open_shared
+
+IGNORED_VALUES = {'', 'n/a', 'na', 'none', 'unknown', 'not applicable'}
+
+def normalize_value(value):
+    return ' '.join(str(value).lower().split())
+
+def tags_from_predictions(gender, style, predictions):
+    # One posting per (attribute, value), scored by the most confident
+    # prediction that produced it. Style and gender come from the catalog
+    # layout rather than the model.
+    tags = {('gender', gender): 1.0, ('style', style): 1.0}
+    for prediction in predictions:
+        if not isinstance(prediction, dict):
+            continue
+        try:
+            score = float(prediction.get('score', 0))
+        except (TypeError, ValueError):
+            continue
+        if score < TAGGING_CONFIG['min_score']:
+            continue
+        for attribute in TAGGING_CONFIG['attributes']:
+            value = normalize_value(prediction.get(attribute) or '')
+            if value not in IGNORED_VALUES:
+                tags[(attribute, value)] = max(score, tags.get((attribute, value), 0.0))
+    return tags
+
+class TagIndex(SQLiteStore):
+    def __init__(self, db_path, refresh_seconds=30):
+        super().__init__(db_path)
+        self.refresh_seconds = refresh_seconds
+        self.postings = {}
+        self.version = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tagged_images (
+                    image_key TEXT PRIMARY KEY,
+                    gender TEXT NOT NULL,
+                    style TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    tagged_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_tags (
+                    attribute TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    image_key TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    PRIMARY KEY (attribute, value, image_key)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS image_tags_by_key ON image_tags (image_key)")
+
+    def record(self, image_key, gender, style, predictions=None, error=None):
+        # Each image is committed on its own, so an interrupted run keeps
+        # everything tagged so far and the next run resumes after it.
+        with self._connection() as conn:
+            conn.execute("DELETE FROM image_tags WHERE image_key = ?", (image_key,))
+            if error is None:
+                conn.executemany(
+                    "INSERT INTO image_tags (attribute, value, image_key, score) VALUES (?, ?, ?, ?)",
+                    [(attribute, value, image_key, score)
+                     for (attribute, value), score in tags_from_predictions(gender, style, predictions).items()]
+                )
+            conn.execute("""
+                INSERT INTO tagged_images (image_key, gender, style, status, error, tagged_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(image_key) DO UPDATE SET
+                    gender = excluded.gender,
+                    style = excluded.style,
+                    status = excluded.status,
+                    error = excluded.error,
+                    tagged_at = excluded.tagged_at
+            """, (image_key, gender, style, 'error' if error else 'done', error, time.time()))
+
+    def completed(self):
+        return {
+            image_key
+            for (image_key,) in self._connection().execute("SELECT image_key FROM tagged_images WHERE status = 'done'")
+        }
+
+    def totals(self):
+        conn = self._connection()
+        statuses = conn.execute("SELECT status, COUNT(*) FROM tagged_images GROUP BY status ORDER BY status").fetchall()
+        values = conn.execute("""
+            SELECT attribute, COUNT(DISTINCT value) FROM image_tags GROUP BY attribute ORDER BY attribute
+        """).fetchall()
+        return statuses, values
+
+    def _refresh(self):
+        # Queries run against an in-memory copy of the postings. It is checked
+        # at most every refresh_seconds and only reloaded when a tagging run
+        # has written something since.
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.loaded_at < self.refresh_seconds:
+            return
+        with self.lock:
+            if self.loaded_at is not None and now - self.loaded_at < self.refresh_seconds:
+                return
+            conn = self._connection()
+            version = conn.execute("SELECT COUNT(*), MAX(tagged_at) FROM tagged_images").fetchone()
+            if version != self.version:
+                postings = {}
+                for attribute, value, image_key, score in conn.execute(
+                    "SELECT attribute, value, image_key, score FROM image_tags"
+                ):
+                    postings.setdefault((attribute, value), {})[image_key] = score
+                self.postings = postings
+                self.version = version
+            self.loaded_at = now
+
+    def search(self, filters, limit):
+        # Intersects the posting lists smallest first and ranks the matches
+        # by their summed scores. Returns (total matches, top `limit`).
+        self._refresh()
+        with metrics.span('tag_search'):
+            lists = sorted((self.postings.get(item, {}) for item in filters.items()), key=len)
+            matches = set(lists[0])
+            for posting in lists[1:]:
+                matches.intersection_update(posting)
+                if not matches:
+                    break
+            ranked = heapq.nlargest(limit, ((sum(posting[key] for posting in lists), key) for key in matches))
+        return len(matches), ranked
+
+def get_tag_index():
+    return open_shared(TagIndex, TAGGING_CONFIG['index'], TAGGING_CONFIG['refresh_seconds'], must_exist=True)
+
+def parse_tag_query(args):
+    # Returns (filters, limit, error).
+    filters = {}
+    for attribute in TAGGING_CONFIG['attributes'] + ['style', 'gender']:
+        value = args.get(attribute)
+        if value:
+            filters[attribute] = normalize_value(value)
+    if not filters:
+        return None, None, 'At least one attribute filter is required'
+    try:
+        limit = int(args.get('limit', 50))
+    except ValueError:
+        return None, None, 'Invalid parameters'
+    if limit < 1:
+        return None, None, 'Invalid parameters'
+    return filters, min(limit, TAGGING_CONFIG['max_results']), None
+
+def search_catalog(index, filters, limit, catalog):
+    total, ranked = index.search(filters, limit)
+    return {
+        'total': total,
+        'images': [{
+            'image_key': image_key,
+            'image_url': catalog.get_image_url(image_key),
+            'score': round(score, 3)
+        } for score, image_key in ranked]
+    }
+
+def setup_tag_routes(app):
+    from flask import jsonify, request
+    from storage import create_catalog
+
+    catalog = create_catalog()
+
+    @app.route(TAGGING_CONFIG['route'], methods=['GET'])
+    def search_tags():
+        index = get_tag_index()
+        if index is None:
+            return jsonify({'error': 'Catalog has not been tagged'}), 404
+        filters, limit, error = parse_tag_query(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+        return jsonify(search_catalog(index, filters, limit, catalog))
+
+def tag_batch(catalog, index, batch):
+    from image_analysis import process_image_batch
+
+    urls = {image_key: catalog.get_image_url(image_key) for image_key, _, _ in batch}
+    for image_key, gender, style in batch:
+        if not urls[image_key]:
+            index.record(image_key, gender, style, error='No image URL')
+    batch = [item for item in batch if urls[item[0]]]
+    results = process_image_batch([urls[image_key] for image_key, _, _ in batch]) if batch else []
+
+    tagged = 0
+    for (image_key, gender, style), result in zip(batch, results):
+        analysis = result.get('analysis') or {}
+        predictions = analysis.get('predictions')
+        if isinstance(predictions, list):
+            index.record(image_key, gender, style, predictions)
+            tagged += 1
+        else:
+            index.record(image_key, gender, style, error=result.get('error') or analysis.get('error') or 'No predictions')
+    return tagged
+
+def run_tagging(catalog, index, genders, workers=4, batch_size=4, force=False, limit=None):
+    done = set() if force else index.completed()
+
+    pending = []
+    for gender in genders:
+        for style, keys in sorted(catalog.get_available_images(gender).items()):
+            pending.extend((key, gender, style) for key in sorted(keys) if key not in done)
+    if limit:
+        pending = pending[:limit]
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    totals = {'images': len(pending), 'tagged': 0, 'errors': 0, 'interrupted': False}
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(tag_batch, catalog, index, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                tagged = future.result()
+            except Exception as e:
+                totals['errors'] += len(futures[future])
+                print(f"Error tagging batch starting at {futures[future][0][0]}: {e}")
+                continue
+            totals['tagged'] += tagged
+            totals['errors'] += len(futures[future]) - tagged
+    except KeyboardInterrupt:
+        # Batches already sent finish and are recorded; the rest are left
+        # for the next run.
+        totals['interrupted'] = True
+        executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        executor.shutdown(wait=True)
+    return totals
+
+def main():
+    from storage import create_catalog
+
+    parser = argparse.ArgumentParser(description="Tag catalog images and build the attribute index")
+    parser.add_argument('--gender', action='append', choices=['men', 'women'])
+    parser.add_argument('--workers', type=int, default=TAGGING_CONFIG['workers'])
+    parser.add_argument('--batch-size', type=int, default=ANALYSIS_CONFIG['batch_size'])
+    parser.add_argument('--limit', type=int, help="Tag at most this many images in this run")
+    parser.add_argument('--force', action='store_true', help="Re-tag images that were already tagged")
+    args = parser.parse_args()
+
+    index = TagIndex(TAGGING_CONFIG['index'])
+    start = time.perf_counter()
+    totals = run_tagging(create_catalog(proxied=False), index, args.gender or ['men', 'women'],
+                         args.workers, max(1, args.batch_size), args.force, args.limit)
+    print(f"Tagged {totals['tagged']} of {totals['images']} images in {time.perf_counter() - start:.1f}s ({totals['errors']} errors)")
+    if totals['interrupted']:
+        print("Interrupted; run again to resume")
+
+    statuses, values = index.totals()
+    print("\nImages by status:")
+    print("-" * 40)
+    for status, count in statuses:
+        print(f"{status}: {count}")
+    print("\nDistinct values by attribute:")
+    print("-" * 40)
+    for attribute, count in values:
+        print(f"{attribute}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,11 @@ import random
 import time
 
 class ImageSelector:
-    def __init__(self, params):
+    def __init__(self, params, image_order=None, image_stats=None):
         self.params = params
         self.shown_images = set()
+        self.image_order = image_order or {}
+        self.image_stats = image_stats
 
     def calculate_exploration_scores(self, available_images, style_scores, style_interaction_count, style_last_shown):
         current_time = time.time()
@@ -31,10 +33,31 @@ class ImageSelector:
         return random.choices(list(available_images.keys()), weights=weights, k=1)[0]
 
     def select_image(self, available_images, style):
+        ranked = self.image_order.get(style)
+        if ranked and random.random() < self.params['PRIOR_IMAGE_WEIGHT']:
+            catalog = set(available_images[style])
+            top = []
+            for image in ranked:
+                if image in catalog and image not in self.shown_images:
+                    top.append(image)
+                    if len(top) == self.params['PRIOR_TOP_K']:
+                        break
+            if top:
+                image = random.choice(top)
+                self.shown_images.add(image)
+                return image
+
         available = [img for img in available_images[style] if img not in self.shown_images]
         if not available:
             return None
         
-        selected_image = random.choice(available)
+        if self.image_stats:
+            # Weight a small random sample by how informative each image has
+            # been, so lookups stay bounded regardless of catalog size.
+            candidates = random.sample(available, min(self.params['INFORMATIVE_CANDIDATES'], len(available)))
+            weights = [self.image_stats.information(img) + 0.05 for img in candidates]
+            selected_image = random.choices(candidates, weights=weights, k=1)[0]
+        else:
+            selected_image = random.choice(available)
         self.shown_images.add(selected_image)
         return selected_image
\ No newline at end of file
@@ -0,0 +1,100 @@
+import mmap
+import os
+import struct
+import threading
+
+# exposures, likes, dislikes
+RECORD = struct.Struct('<III')
+
+class ImageStats:
+    def __init__(self, path, initial_capacity=4096):
+        # Counters live in a fixed-width record file indexed by catalog
+        # position; the sidecar .keys file maps image keys to positions in
+        # the order they were first seen.
+        self.path = path
+        self.keys_path = f"{path}.keys"
+        self.lock = threading.Lock()
+        self.index = {}
+
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as f:
+                for line in f:
+                    key = line.rstrip('\n')
+                    if key:
+                        self.index[key] = len(self.index)
+
+        self.keys_file = open(self.keys_path, 'a')
+        self.capacity = max(initial_capacity, len(self.index))
+        self._open_table(self.capacity)
+
+    def _open_table(self, capacity):
+        size = capacity * RECORD.size
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        with open(self.path, mode) as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < size:
+                f.truncate(size)
+            else:
+                capacity = f.tell() // RECORD.size
+            self.table = mmap.mmap(f.fileno(), capacity * RECORD.size)
+        self.capacity = capacity
+
+    def _slot(self, image_key):
+        slot = self.index.get(image_key)
+        if slot is not None:
+            return slot
+
+        slot = len(self.index)
+        if slot >= self.capacity:
+            self.table.flush()
+            self.table.close()
+            self._open_table(self.capacity * 2)
+        self.index[image_key] = slot
+        self.keys_file.write(image_key + '\n')
+        self.keys_file.flush()
+        return slot
+
+    def _add(self, image_key, exposures=0, likes=0, dislikes=0):
+        with self.lock:
+            offset = self._slot(image_key) * RECORD.size
+            e, l, d = RECORD.unpack_from(self.table, offset)
+            RECORD.pack_into(self.table, offset, e + exposures, l + likes, d + dislikes)
+
+    def record_exposure(self, image_key):
+        self._add(image_key, exposures=1)
+
+    def record_feedback(self, image_key, feedback):
+        if feedback == 'like':
+            self._add(image_key, likes=1)
+        else:
+            self._add(image_key, dislikes=1)
+
+    def get(self, image_key):
+        with self.lock:
+            slot = self.index.get(image_key)
+            if slot is None:
+                return 0, 0, 0
+            return RECORD.unpack_from(self.table, slot * RECORD.size)
+
+    def information(self, image_key):
+        # Smoothed like rate p; p * (1 - p) peaks for images that split
+        # opinion and falls towards zero for ones nearly everyone agrees on.
+        # Unseen images sit at the maximum so they still get explored.
+        _, likes, dislikes = self.get(image_key)
+        p = (likes + 1) / (likes + dislikes + 2)
+        return 4 * p * (1 - p)
+
+    def summary(self, image_key):
+        exposures, likes, dislikes = self.get(image_key)
+        rated = likes + dislikes
+        return {
+            'exposures': exposures,
+            'likes': likes,
+            'dislikes': dislikes,
+            'like_rate': likes / rated if rated else 0.0,
+            'information': self.information(image_key)
+        }
+
+    def flush(self):
+        with self.lock:
+            self.table.flush()
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+from collections import defaultdict
+
+# Feedback from sessions registered without a known cohort.
+DEFAULT_COHORT = 'default'
+
+class StyleAggregates:
+    def __init__(self, shards=16):
+        # Counters are striped across independently locked shards keyed by
+        # the counter, so concurrent feedback on different styles/images
+        # never contends on the same lock.
+        self.shard_count = shards
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.style_shards = [defaultdict(lambda: [0, 0]) for _ in range(shards)]
+        self.image_shards = [defaultdict(lambda: [0, 0]) for _ in range(shards)]
+        self.events_since_flush = 0
+        self.events_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flush_needed = threading.Event()
+        self.flush_every = None
+
+    def _shard(self, key):
+        return hash(key) % self.shard_count
+
+    def record(self, gender, style, image_key, feedback, cohort=DEFAULT_COHORT):
+        slot = 0 if feedback == 'like' else 1
+
+        style_key = (gender, cohort, style)
+        idx = self._shard(style_key)
+        with self.locks[idx]:
+            self.style_shards[idx][style_key][slot] += 1
+
+        image_key = (gender, cohort, style, image_key)
+        idx = self._shard(image_key)
+        with self.locks[idx]:
+            self.image_shards[idx][image_key][slot] += 1
+
+        with self.events_lock:
+            self.events_since_flush += 1
+            due = self.flush_every and self.events_since_flush >= self.flush_every
+        if due:
+            self.flush_needed.set()
+
+    def _collect(self, shards):
+        merged = {}
+        for idx, shard in enumerate(shards):
+            with self.locks[idx]:
+                merged.update((key, list(counts)) for key, counts in shard.items())
+        return merged
+
+    def cohorts(self):
+        return sorted({(g, c) for g, c, _ in self._collect(self.style_shards)})
+
+    def style_counts(self, gender=None, cohort=None):
+        # Counts are summed over all cohorts unless one is given.
+        totals = defaultdict(lambda: [0, 0])
+        for (g, c, style), (likes, dislikes) in self._collect(self.style_shards).items():
+            if (gender and g != gender) or (cohort and c != cohort):
+                continue
+            counts = totals[(g, style)]
+            counts[0] += likes
+            counts[1] += dislikes
+
+        result = defaultdict(dict)
+        for (g, style), (likes, dislikes) in totals.items():
+            result[g][style] = _format_counts(likes, dislikes)
+        return dict(result)
+
+    def image_counts(self, gender=None, style=None, limit=None, cohort=None):
+        totals = defaultdict(lambda: [0, 0])
+        for (g, c, s, image_key), (likes, dislikes) in self._collect(self.image_shards).items():
+            if (gender and g != gender) or (style and s != style) or (cohort and c != cohort):
+                continue
+            counts = totals[(g, s, image_key)]
+            counts[0] += likes
+            counts[1] += dislikes
+
+        result = defaultdict(list)
+        for (g, s, image_key), (likes, dislikes) in totals.items():
+            result[g].append(dict(_format_counts(likes, dislikes), image=image_key, style=s))
+
+        for g in result:
+            result[g].sort(key=lambda entry: (entry['likes'] + entry['dislikes'], entry['likes']), reverse=True)
+            if limit:
+                result[g] = result[g][:limit]
+        return dict(result)
+
+    def to_dict(self):
+        return {
+            'styles': [[g, c, s, likes, dislikes] for (g, c, s), (likes, dislikes) in self._collect(self.style_shards).items()],
+            'images': [[g, c, s, key, likes, dislikes] for (g, c, s, key), (likes, dislikes) in self._collect(self.image_shards).items()]
+        }
+
+    def load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        # Files written before cohorts were recorded have no cohort column.
+        for row in data.get('styles', []):
+            if len(row) == 4:
+                row = [row[0], DEFAULT_COHORT] + row[1:]
+            g, c, s, likes, dislikes = row
+            key = (g, c, s)
+            self.style_shards[self._shard(key)][key] = [likes, dislikes]
+        for row in data.get('images', []):
+            if len(row) == 5:
+                row = [row[0], DEFAULT_COHORT] + row[1:]
+            g, c, s, image_key, likes, dislikes = row
+            key = (g, c, s, image_key)
+            self.image_shards[self._shard(key)][key] = [likes, dislikes]
+
+    def save(self, path):
+        # Events recorded while the file is being written count towards the
+        # next save.
+        with self.events_lock:
+            flushed = self.events_since_flush
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+        with self.events_lock:
+            self.events_since_flush -= flushed
+
+    def maybe_save(self, path, every):
+        if self.events_since_flush < every or not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            self.save(path)
+        except OSError as e:
+            print(f"Error saving style aggregates: {e}")
+        finally:
+            self.flush_lock.release()
+
+    def start_autosave(self, path, every, interval):
+        # Saves on a background thread once `every` events have been recorded,
+        # or after `interval` seconds if there are any, so feedback handlers
+        # never serialise the counters themselves.
+        self.flush_every = every
+
+        def run():
+            while True:
+                self.flush_needed.wait(interval)
+                self.flush_needed.clear()
+                self.maybe_save(path, 1)
+        thread = threading.Thread(target=run, name='aggregates-autosave', daemon=True)
+        thread.start()
+        return thread
+
+def _format_counts(likes, dislikes):
+    total = likes + dislikes
+    return {
+        'likes': likes,
+        'dislikes': dislikes,
+        'like_rate': likes / total if total else 0.0
+    }
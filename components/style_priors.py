@@ -0,0 +1,102 @@
+import json
+from types import MappingProxyType
+from components.style_aggregates import DEFAULT_COHORT
+
+class StylePriors:
+    def __init__(self, cohorts):
+        # {gender: {cohort: {'style_scores': {...}, 'image_order': {...}}}}
+        # frozen so every session can reference the same objects safely.
+        self.cohorts = MappingProxyType({
+            gender: MappingProxyType({
+                cohort: _freeze(prior) for cohort, prior in by_cohort.items()
+            })
+            for gender, by_cohort in cohorts.items()
+        })
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_aggregates(cls, aggregates, strength=1.0, min_events=20, top_images=50):
+        # The default prior pools every cohort; each named cohort gets its own
+        # once it has min_events of feedback, and falls back to the default
+        # until then.
+        cohorts = {}
+        for gender in aggregates.style_counts():
+            prior = _build_prior(aggregates, gender, None, strength, min_events, top_images)
+            if prior:
+                cohorts[gender] = {DEFAULT_COHORT: prior}
+        for gender, cohort in aggregates.cohorts():
+            if cohort == DEFAULT_COHORT or gender not in cohorts:
+                continue
+            prior = _build_prior(aggregates, gender, cohort, strength, min_events, top_images)
+            if prior and prior['events'] >= min_events:
+                cohorts[gender][cohort] = prior
+        return cls(cohorts)
+
+    def to_dict(self):
+        return {
+            gender: {
+                cohort: {
+                    'style_scores': dict(prior['style_scores']),
+                    'image_order': {style: list(keys) for style, keys in prior['image_order'].items()}
+                }
+                for cohort, prior in by_cohort.items()
+            }
+            for gender, by_cohort in self.cohorts.items()
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def for_session(self, gender, cohort=None):
+        by_cohort = self.cohorts.get(gender)
+        if not by_cohort:
+            return None
+        return by_cohort.get(cohort or DEFAULT_COHORT) or by_cohort.get(DEFAULT_COHORT)
+
+def _build_prior(aggregates, gender, cohort, strength, min_events, top_images):
+    styles = aggregates.style_counts(gender, cohort).get(gender, {})
+    total_likes = sum(c['likes'] for c in styles.values())
+    total = sum(c['likes'] + c['dislikes'] for c in styles.values())
+    if not total:
+        return None
+    mean_rate = total_likes / total
+
+    # Shrink each style's like rate towards the population mean by
+    # how much evidence it has, so sparse styles start near zero.
+    style_scores = {}
+    for style, counts in styles.items():
+        events = counts['likes'] + counts['dislikes']
+        confidence = events / (events + min_events)
+        style_scores[style] = strength * (counts['like_rate'] - mean_rate) * confidence * 2
+
+    image_order = {}
+    for entry in aggregates.image_counts(gender, cohort=cohort).get(gender, []):
+        image_order.setdefault(entry['style'], []).append(entry)
+    # Order images by how split their feedback is rather than by like
+    # rate: showing the most-liked images first tells a new session
+    # little and only makes them more liked.
+    for style, entries in image_order.items():
+        entries.sort(key=_split_feedback, reverse=True)
+        image_order[style] = [e['image'] for e in entries[:top_images]]
+
+    return {'style_scores': style_scores, 'image_order': image_order, 'events': total}
+
+def _split_feedback(entry):
+    # Smoothed p * (1 - p), highest for images that divide opinion; ties go
+    # to the image with more feedback behind it.
+    likes, dislikes = entry['likes'], entry['dislikes']
+    p = (likes + 1) / (likes + dislikes + 2)
+    return 4 * p * (1 - p), likes + dislikes
+
+def _freeze(prior):
+    return MappingProxyType({
+        'style_scores': MappingProxyType(dict(prior.get('style_scores', {}))),
+        'image_order': MappingProxyType({
+            style: tuple(keys) for style, keys in prior.get('image_order', {}).items()
+        })
+    })
@@ -1,12 +1,17 @@
 # S3 Configuration
 import os
+import tempfile
 from dotenv import load_dotenv
 load_dotenv()
 S3_CONFIG = {
     'aws_access_key_id': os.getenv('aws_access_key_id'),
     'aws_secret_access_key': os.getenv('aws_secret_access_key'),
     'bucket_name': 'ethos-style-images',
-    'prefix': 'Styles/'
+    'prefix': 'Styles/',
+    # Written by `python catalog_manifest.py inventory`; when present the
+    # catalog is read from it instead of listing the bucket per request.
+    'catalog_manifest': os.getenv('CATALOG_MANIFEST', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog_manifest.db')),
+    'catalog_refresh_seconds': 30
 }
 
 # Algorithm Parameters
@@ -16,5 +21,232 @@ ALGORITHM_PARAMS = {
     'DECAY_FACTOR': 0.98,
     'BASELINE': 0.5,
     'RECENCY_WEIGHT': 1.2,
-    'EXPLORATION_FACTOR': 0.2
-}
\ No newline at end of file
+    'EXPLORATION_FACTOR': 0.2,
+    'PRIOR_IMAGE_WEIGHT': 0.7,
+    # Prior-ordered picks are drawn at random from this many of the best
+    # unseen images, so sessions do not all open with the same ones.
+    'PRIOR_TOP_K': 8,
+    'INFORMATIVE_CANDIDATES': 16
+}
+
+# Metrics
+METRICS_CONFIG = {
+    'enabled': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+    'sample_rate': float(os.getenv('METRICS_SAMPLE_RATE', '1.0')),
+    'buckets': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+}
+
+# Per-request profiling
+PROFILING_CONFIG = {
+    'enabled': os.getenv('PROFILING_ENABLED', 'false').lower() == 'true',
+    'admin_token': os.getenv('PROFILING_ADMIN_TOKEN'),
+    'header': 'X-Profile-Request',
+    'path_prefixes': ('/api/preference/', '/remove-background'),
+    'min_interval_seconds': 30,
+    'max_armed': 10,
+    'max_profiles': 50,
+    'output_dir': os.getenv('PROFILING_OUTPUT_DIR', os.path.join(tempfile.gettempdir(), 'ethos-profiles'))
+}
+
+# Service split: quiz and image routes can run as separate processes.
+# Quiz sessions live in process memory, so the quiz service must run a single
+# worker process and scale with threads.
+SERVICES_CONFIG = {
+    'enabled': tuple(name.strip() for name in os.getenv('SERVICES', 'quiz,image').split(',') if name.strip()),
+    'quiz': {
+        'port': int(os.getenv('QUIZ_PORT', '5020')),
+        'workers': 1,
+        'threads': int(os.getenv('QUIZ_THREADS', '16')),
+        'timeout': int(os.getenv('QUIZ_TIMEOUT', '30'))
+    },
+    'image': {
+        'port': int(os.getenv('IMAGE_PORT', '5021')),
+        'workers': int(os.getenv('IMAGE_WORKERS', str(os.cpu_count() or 2))),
+        'threads': int(os.getenv('IMAGE_THREADS', '2')),
+        'timeout': int(os.getenv('IMAGE_TIMEOUT', '300'))
+    }
+}
+
+# Async (ASGI) serving mode for the quiz API
+ASYNC_CONFIG = {
+    'port': int(os.getenv('ASYNC_PORT', '5022')),
+    'io_threads': int(os.getenv('ASYNC_IO_THREADS', '8'))
+}
+
+# Next-image prefetching on feedback POSTs
+PREFETCH_CONFIG = {
+    'speculative': os.getenv('PREFETCH_SPECULATIVE', 'false').lower() == 'true',
+    'threads': int(os.getenv('PREFETCH_THREADS', '4')),
+    'wait_seconds': 5
+}
+
+# Batch quiz endpoints
+BATCH_CONFIG = {
+    'default_count': 5,
+    'max_count': 10
+}
+
+# Cross-session style popularity counters
+AGGREGATES_CONFIG = {
+    'shards': 16,
+    # Saved by a background thread after flush_every events, or flush_seconds
+    # after the last save if anything changed.
+    'flush_every': int(os.getenv('AGGREGATES_FLUSH_EVERY', '50')),
+    'flush_seconds': int(os.getenv('AGGREGATES_FLUSH_SECONDS', '30'))
+}
+
+# Warm-start priors for new sessions
+PRIORS_CONFIG = {
+    'enabled': os.getenv('PRIORS_ENABLED', 'true').lower() == 'true',
+    'strength': float(os.getenv('PRIORS_STRENGTH', '1.0')),
+    'min_events': 20,
+    'top_images': 50,
+    # Cohorts clients may register under; any other value is counted and
+    # primed as the default cohort.
+    'cohorts': tuple(name.strip() for name in os.getenv('PRIOR_COHORTS', '').split(',') if name.strip())
+}
+
+# Per-image exposure/feedback statistics
+IMAGE_STATS_CONFIG = {
+    'enabled': os.getenv('IMAGE_STATS_ENABLED', 'true').lower() == 'true',
+    # 'random' keeps uniform image choice; 'informative' biases selection
+    # towards images whose feedback is still split.
+    'selection_mode': os.getenv('IMAGE_SELECTION_MODE', 'random'),
+    'initial_capacity': 4096
+}
+
+# Profile store
+PROFILE_STORE_CONFIG = {
+    'cache_size': int(os.getenv('PROFILE_CACHE_SIZE', '1024')),
+    'max_history_page': 100
+}
+
+# Columnar profile exports
+EXPORT_CONFIG = {
+    'output_dir': os.getenv('EXPORT_DIR', 'exports'),
+    'chunk_rows': int(os.getenv('EXPORT_CHUNK_ROWS', '50000'))
+}
+
+# JSON serialisation and response compression
+RESPONSE_CONFIG = {
+    # 'orjson' falls back to Flask's encoder when the package is missing.
+    'json_provider': os.getenv('JSON_PROVIDER', 'orjson'),
+    'compression': os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true',
+    'min_size': int(os.getenv('COMPRESSION_MIN_SIZE', '1024')),
+    'gzip_level': 6,
+    'brotli_quality': 5,
+    'mimetypes': ('application/json', 'text/plain', 'text/html', 'text/csv')
+}
+
+# Image catalog/storage backend: 's3' or 'local'. The local backend reads the
+# same Styles/<gender>/<style>-style/<file> layout from local_root and serves
+# it under local_route.
+STORAGE_CONFIG = {
+    'backend': os.getenv('STORAGE_BACKEND', 's3'),
+    'local_root': os.getenv('LOCAL_IMAGE_ROOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')),
+    'local_base_url': os.getenv('LOCAL_IMAGE_BASE_URL', 'http://localhost:5020'),
+    'local_route': '/images',
+    'local_refresh_seconds': 30
+}
+
+# Resized quiz image variants generated by derivatives.py
+DERIVATIVES_CONFIG = {
+    'enabled': os.getenv('DERIVATIVES_ENABLED', 'true').lower() == 'true',
+    'prefix': 'Derivatives/',
+    'format': os.getenv('DERIVATIVE_FORMAT', 'webp'),
+    'quality': 75,
+    'size_classes': {'small': 320, 'medium': 640, 'large': 1080},
+    'workers': 8,
+    'index': os.getenv('DERIVATIVES_INDEX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'derivatives.db')),
+    'refresh_seconds': 30
+}
+
+# Optional image proxy in the quiz service. When enabled, image_url points at
+# this route, which serves catalog objects from a bounded on-disk LRU cache.
+IMAGE_PROXY_CONFIG = {
+    'enabled': os.getenv('IMAGE_PROXY_ENABLED', 'false').lower() == 'true',
+    'base_url': os.getenv('IMAGE_PROXY_BASE_URL', 'http://localhost:5020'),
+    'route': '/api/images',
+    'cache_dir': os.getenv('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ethos-image-cache')),
+    'max_bytes': int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(2 * 1024 ** 3))),
+    'max_age': 86400,
+    # How long a cached object is served before its source version is checked
+    # again, so variants rebuilt with derivatives.py --force are picked up.
+    'revalidate_seconds': int(os.getenv('IMAGE_CACHE_REVALIDATE_SECONDS', '300')),
+    # Let a fronting nginx/Apache send cache hits with X-Sendfile.
+    'x_sendfile': os.getenv('IMAGE_PROXY_X_SENDFILE', 'false').lower() == 'true'
+}
+
+# In-memory quiz sessions
+SESSION_CONFIG = {
+    'lock_stripes': int(os.getenv('SESSION_LOCK_STRIPES', '64'))
+}
+
+# Admission control for the image endpoints. Each endpoint runs at most
+# `concurrency` requests at once with up to `queue` more waiting (for at most
+# queue_timeout seconds); anything beyond that gets 429 + Retry-After.
+ADMISSION_CONFIG = {
+    'enabled': os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true',
+    # Per-client-address token bucket, charged one token per image.
+    'rate_per_second': float(os.getenv('ADMISSION_RATE', '1.0')),
+    'burst': int(os.getenv('ADMISSION_BURST', '30')),
+    'retry_after': 5,
+    'analysis_threads': int(os.getenv('ANALYSIS_THREADS', '10')),
+    'endpoints': {
+        'analyze_image': {'concurrency': 8, 'queue': 16, 'queue_timeout': 10, 'max_batch': 1},
+        'analyze_images': {'concurrency': 2, 'queue': 4, 'queue_timeout': 10, 'max_batch': 20},
+        'remove_background': {'concurrency': 2, 'queue': 4, 'queue_timeout': 30, 'max_batch': 10}
+    }
+}
+
+# Request deadlines. Each request gets a time budget from the header (in
+# milliseconds) or its route's default; outbound calls are given whatever is
+# left of it, capped by their own timeouts below.
+DEADLINE_CONFIG = {
+    'header': 'X-Request-Deadline-Ms',
+    'default_seconds': 30,
+    'max_seconds': 300,
+    'routes': {
+        'analyze_image': 30,
+        'analyze_images': 60,
+        'remove_background': 120
+    },
+    'openai_timeout': 30,
+    'download_timeout': 15,
+    # boto3 clients are created once, so S3 gets fixed per-attempt timeouts.
+    's3_connect_timeout': 3,
+    's3_read_timeout': 10,
+    's3_max_attempts': 3
+}
+
+# Image classification. With batching on, /analyze-images sends up to
+# batch_size images per chat completion using the compact batch prompt and
+# falls back to one call per image for any result it cannot map back.
+ANALYSIS_CONFIG = {
+    'model': os.getenv('ANALYSIS_MODEL', 'gpt-4o-mini'),
+    'batching': os.getenv('ANALYSIS_BATCHING', 'true').lower() == 'true',
+    'batch_size': int(os.getenv('ANALYSIS_BATCH_SIZE', '4')),
+    # Fetch and downscale images here and send them as data URLs with
+    # low-detail analysis instead of letting the provider fetch the original.
+    'inline_images': os.getenv('ANALYSIS_INLINE_IMAGES', 'false').lower() == 'true',
+    'inline_max_edge': int(os.getenv('ANALYSIS_INLINE_MAX_EDGE', '512')),
+    'inline_format': os.getenv('ANALYSIS_INLINE_FORMAT', 'jpeg'),
+    'inline_quality': 80,
+    'inline_detail': 'low',
+    'inline_fetch_threads': 8,
+    'inline_cache_entries': int(os.getenv('ANALYSIS_INLINE_CACHE_ENTRIES', '512'))
+}
+
+# Catalog tagging. catalog_tags.py classifies every catalog image and keeps
+# the predictions in an inverted attribute index that the quiz service
+# queries at `route`.
+TAGGING_CONFIG = {
+    'index': os.getenv('TAG_INDEX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog_tags.db')),
+    'workers': 4,
+    # Predictions scored below this are not indexed.
+    'min_score': 0.3,
+    'attributes': ['label', 'pattern', 'color', 'material'],
+    'route': '/api/catalog/tags',
+    'max_results': 500,
+    'refresh_seconds': 30
+}
@@ -0,0 +1,64 @@
+import math
+import time
+from config import DEADLINE_CONFIG
+
+class DeadlineExceeded(Exception):
+    pass
+
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def check(self, what='request'):
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.seconds:.1f}s exceeded before {what}")
+
+    def timeout(self, cap=None):
+        # Timeout for one outbound call: what is left of the deadline, capped
+        # by the call's own limit, and never zero so clients do not treat it
+        # as "no timeout".
+        remaining = self.remaining()
+        if cap is not None:
+            remaining = min(remaining, cap)
+        return max(remaining, 0.05)
+
+def current_deadline():
+    from flask import g, has_request_context
+    if has_request_context():
+        return g.get('deadline')
+    return None
+
+def call_timeout(deadline, cap):
+    # Used by outbound calls that may run outside a request (scripts, worker
+    # threads without a deadline): fall back to the call's own cap.
+    deadline = deadline or current_deadline()
+    if deadline is None:
+        return cap
+    deadline.check()
+    return deadline.timeout(cap)
+
+def parse_deadline(header_value, endpoint):
+    seconds = DEADLINE_CONFIG['routes'].get(endpoint, DEADLINE_CONFIG['default_seconds'])
+    if header_value:
+        try:
+            requested = float(header_value) / 1000
+        except ValueError:
+            requested = None
+        # NaN would slip past the clamp below and never expire.
+        if requested is not None and math.isfinite(requested):
+            seconds = requested
+    return Deadline(min(max(seconds, 0.0), DEADLINE_CONFIG['max_seconds']))
+
+def setup_deadlines(app):
+    from flask import g, request
+
+    @app.before_request
+    def start_deadline():
+        g.deadline = parse_deadline(request.headers.get(DEADLINE_CONFIG['header']), request.endpoint)
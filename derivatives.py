@@ -0,0 +1,165 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+from config import DERIVATIVES_CONFIG
+from metrics import metrics
+from sqlite_store import SQLiteStore, open_shared
+
+class DerivativeIndex(SQLiteStore):
+    def __init__(self, db_path, refresh_seconds=30):
+        super().__init__(db_path)
+        self.refresh_seconds = refresh_seconds
+        self.keys = {}
+        self.version = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS derivatives (
+                    source_key TEXT NOT NULL,
+                    size_class TEXT NOT NULL,
+                    derivative_key TEXT NOT NULL,
+                    source_bytes INTEGER NOT NULL,
+                    derivative_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (source_key, size_class)
+                )
+            """)
+
+    def record(self, source_key, size_class, derivative_key, source_bytes, derivative_bytes):
+        with self._connection() as conn:
+            conn.execute("""
+                INSERT INTO derivatives (source_key, size_class, derivative_key, source_bytes, derivative_bytes, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source_key, size_class) DO UPDATE SET
+                    derivative_key = excluded.derivative_key,
+                    source_bytes = excluded.source_bytes,
+                    derivative_bytes = excluded.derivative_bytes,
+                    created_at = excluded.created_at
+            """, (source_key, size_class, derivative_key, source_bytes, derivative_bytes, time.time()))
+
+    def completed(self):
+        return {
+            (source_key, size_class)
+            for source_key, size_class in self._connection().execute("SELECT source_key, size_class FROM derivatives")
+        }
+
+    def totals(self):
+        return self._connection().execute("""
+            SELECT size_class, COUNT(*), SUM(source_bytes), SUM(derivative_bytes)
+            FROM derivatives GROUP BY size_class ORDER BY size_class
+        """).fetchall()
+
+    def _refresh(self):
+        # The API reads from an in-memory copy of the index. It is checked at
+        # most every refresh_seconds and only reloaded when derivatives.py has
+        # written something since.
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.loaded_at < self.refresh_seconds:
+            return
+        with self.lock:
+            if self.loaded_at is not None and now - self.loaded_at < self.refresh_seconds:
+                return
+            conn = self._connection()
+            version = conn.execute("SELECT COUNT(*), MAX(created_at) FROM derivatives").fetchone()
+            if version != self.version:
+                self.keys = {
+                    (source_key, size_class): derivative_key
+                    for source_key, size_class, derivative_key in conn.execute(
+                        "SELECT source_key, size_class, derivative_key FROM derivatives"
+                    )
+                }
+                self.version = version
+            self.loaded_at = now
+
+    def lookup(self, source_key, size_class):
+        self._refresh()
+        return self.keys.get((source_key, size_class))
+
+def get_derivative_index():
+    return open_shared(DerivativeIndex, DERIVATIVES_CONFIG['index'], DERIVATIVES_CONFIG['refresh_seconds'], must_exist=True)
+
+def derivative_key(source_key, width):
+    base = os.path.splitext(source_key)[0]
+    return f"{DERIVATIVES_CONFIG['prefix']}{width}/{base}.{DERIVATIVES_CONFIG['format']}"
+
+def make_variants(data, size_classes):
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    variants = {}
+    for size_class, width in size_classes.items():
+        variant = image
+        if image.width > width:
+            variant = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        buffer = BytesIO()
+        variant.save(buffer, format=DERIVATIVES_CONFIG['format'].upper(), quality=DERIVATIVES_CONFIG['quality'], method=4)
+        variants[size_class] = buffer.getvalue()
+    return variants
+
+def process_image(catalog, index, source_key, size_classes):
+    data = catalog.read_object(source_key)
+    with metrics.span('derivative_encode'):
+        variants = make_variants(data, size_classes)
+
+    written = 0
+    for size_class, variant in variants.items():
+        key = derivative_key(source_key, size_classes[size_class])
+        catalog.write_object(key, variant, f"image/{DERIVATIVES_CONFIG['format']}")
+        index.record(source_key, size_class, key, len(data), len(variant))
+        written += len(variant)
+    return len(data), written
+
+def run_derivatives(catalog, index, genders, workers=8, force=False):
+    done = set() if force else index.completed()
+    size_classes = DERIVATIVES_CONFIG['size_classes']
+
+    pending = []
+    for gender in genders:
+        for keys in catalog.get_available_images(gender).values():
+            for key in keys:
+                missing = {name: width for name, width in size_classes.items() if (key, name) not in done}
+                if missing:
+                    pending.append((key, missing))
+
+    totals = {'images': len(pending), 'errors': 0, 'source_bytes': 0, 'derivative_bytes': 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_image, catalog, index, key, missing): key for key, missing in pending}
+        for future in as_completed(futures):
+            try:
+                source_bytes, derivative_bytes = future.result()
+            except Exception as e:
+                totals['errors'] += 1
+                print(f"Error creating derivatives for {futures[future]}: {e}")
+                continue
+            totals['source_bytes'] += source_bytes
+            totals['derivative_bytes'] += derivative_bytes
+    return totals
+
+def main():
+    from storage import create_catalog
+
+    parser = argparse.ArgumentParser(description="Generate resized quiz image variants")
+    parser.add_argument('--gender', action='append', choices=['men', 'women'])
+    parser.add_argument('--workers', type=int, default=DERIVATIVES_CONFIG['workers'])
+    parser.add_argument('--force', action='store_true', help="Regenerate variants that already exist")
+    args = parser.parse_args()
+
+    index = DerivativeIndex(DERIVATIVES_CONFIG['index'])
+    start = time.perf_counter()
+    totals = run_derivatives(create_catalog(), index, args.gender or ['men', 'women'], args.workers, args.force)
+    print(f"Processed {totals['images']} images in {time.perf_counter() - start:.1f}s ({totals['errors']} errors)")
+
+    print("\nVariants by size class:")
+    print("-" * 40)
+    for size_class, count, source_bytes, derivative_bytes in index.totals():
+        print(f"{size_class}: {count} images, {source_bytes / 1e6:.1f} MB -> {derivative_bytes / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
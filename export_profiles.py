@@ -0,0 +1,124 @@
+import argparse
+import os
+
+def load_arrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("pyarrow is required for exports: pip install pyarrow")
+    return pyarrow
+
+def event_schema(pa):
+    return pa.schema([
+        ('preference_id', pa.string()),
+        ('iteration', pa.int32()),
+        ('image', pa.string()),
+        ('style', pa.string()),
+        ('feedback', pa.string()),
+        ('score_change', pa.float64()),
+        ('current_score', pa.float64()),
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+    ])
+
+def top_style_schema(pa):
+    return pa.schema([
+        ('preference_id', pa.string()),
+        ('rank', pa.int32()),
+        ('style', pa.string()),
+        ('score', pa.float64()),
+    ])
+
+class ChunkedWriter:
+    # Buffers rows column-wise and writes a row group/record batch every
+    # chunk_rows, so memory is bounded by the chunk size, not the export.
+    def __init__(self, pa, path, schema, fmt, chunk_rows):
+        self.pa = pa
+        self.schema = schema
+        self.chunk_rows = chunk_rows
+        self.columns = {name: [] for name in schema.names}
+        self.rows = 0
+        self.total_rows = 0
+        if fmt == 'parquet':
+            self.writer = pa.parquet.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(path, schema)
+
+    def append(self, row):
+        for name in self.schema.names:
+            self.columns[name].append(row.get(name))
+        self.rows += 1
+        if self.rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        batch = self.pa.RecordBatch.from_pydict(self.columns, schema=self.schema)
+        self.writer.write_batch(batch)
+        self.total_rows += self.rows
+        self.columns = {name: [] for name in self.schema.names}
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def export_profiles(profile_store, output_dir, fmt='parquet', chunk_rows=50000):
+    pa = load_arrow()
+    os.makedirs(output_dir, exist_ok=True)
+    ext = 'parquet' if fmt == 'parquet' else 'arrow'
+
+    events = ChunkedWriter(pa, os.path.join(output_dir, f'selection_events.{ext}'), event_schema(pa), fmt, chunk_rows)
+    top_styles = ChunkedWriter(pa, os.path.join(output_dir, f'top_styles.{ext}'), top_style_schema(pa), fmt, chunk_rows)
+    profiles = 0
+    try:
+        for preference_id, styles, history in profile_store.iter_profiles():
+            profiles += 1
+            # top_styles is the dict get_top_styles() returns, already
+            # ordered best first.
+            for rank, (style, score) in enumerate(styles.items(), 1):
+                top_styles.append({'preference_id': preference_id, 'rank': rank, 'style': style, 'score': score})
+
+            # selection_history is get_selection_history(): one entry per
+            # iteration in order.
+            for iteration, selection in enumerate(history, 1):
+                timestamp = selection.get('timestamp')
+                events.append({
+                    'preference_id': preference_id,
+                    'iteration': iteration,
+                    'image': selection.get('image'),
+                    'style': selection.get('style'),
+                    'feedback': selection.get('feedback'),
+                    'score_change': selection.get('score_change'),
+                    'current_score': selection.get('current_score'),
+                    'timestamp': int(timestamp * 1_000_000) if timestamp is not None else None,
+                })
+    finally:
+        events.close()
+        top_styles.close()
+
+    return {
+        'profiles': profiles,
+        'selection_events': events.total_rows,
+        'top_styles': top_styles.total_rows
+    }
+
+def main():
+    from config import EXPORT_CONFIG
+    from style_algorithm import profile_store
+
+    parser = argparse.ArgumentParser(description="Export saved profiles as flat columnar files")
+    parser.add_argument('--output-dir', default=EXPORT_CONFIG['output_dir'])
+    parser.add_argument('--format', choices=['parquet', 'arrow'], default='parquet')
+    parser.add_argument('--chunk-rows', type=int, default=EXPORT_CONFIG['chunk_rows'])
+    args = parser.parse_args()
+
+    counts = export_profiles(profile_store, args.output_dir, args.format, args.chunk_rows)
+    print(f"Exported {counts['profiles']} profiles to {args.output_dir}")
+    print(f"selection_events: {counts['selection_events']} rows")
+    print(f"top_styles: {counts['top_styles']} rows")
+
+if __name__ == "__main__":
+    main()
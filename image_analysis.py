@@ -1,10 +1,13 @@
-from flask import request, jsonify
+from flask import g, request, jsonify
+from admission import admission_control
+from config import ADMISSION_CONFIG, ANALYSIS_CONFIG, DEADLINE_CONFIG
+from deadlines import DeadlineExceeded, call_timeout
 from image_processor import process_and_upload_image
+from inline_images import image_content, image_contents
+from metrics import metrics
 import json
-from openai import OpenAI
-import boto3
 import concurrent.futures
-from threading import Thread
+import threading
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -87,38 +90,226 @@ Or:
 That is all. Thank you."
 """
 
-openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Sent once per chat completion in batch mode. Bump the version whenever the
+# wording or schema changes; responses carrying another version are rejected.
+BATCH_PROMPT_VERSION = "batch-v1"
+BATCH_CLASSIFICATION_PROMPT = """Classify each of the {count} images below; they are numbered 0 to {last}.
+For each image give one or more predictions of what it shows (label, with score 0.0-1.0) and, for clothing, its pattern, color and material ("" if not applicable).
+Reply with JSON only, exactly one result per image:
+{{"version": "%s", "results": [{{"index": 0, "predictions": [{{"label": "dress", "score": 0.92, "pattern": "striped", "color": "blue", "material": "cotton"}}]}}]}}
+If an image cannot be classified, use {{"index": <n>, "error": "Could not classify image"}} for it.""" % BATCH_PROMPT_VERSION
 
-def process_single_image(image_url):
+_openai_client = None
+_openai_client_lock = threading.Lock()
+
+# Shared by all /analyze-images requests so concurrent batches cannot
+# multiply the number of OpenAI calls in flight.
+analysis_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=ADMISSION_CONFIG['analysis_threads'],
+    thread_name_prefix='analysis'
+)
+
+def get_openai_client():
+    # The OpenAI SDK is only imported and configured on the first
+    # classification so quiz-only workers never pay for it.
+    global _openai_client
+    if _openai_client is None:
+        with _openai_client_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return _openai_client
+
+def classification_client(deadline):
+    # SDK retries are disabled: a retry would start with whatever is left
+    # of the deadline, and the caller already gets a per-image error.
+    return get_openai_client().with_options(
+        timeout=call_timeout(deadline, DEADLINE_CONFIG['openai_timeout']),
+        max_retries=0
+    )
+
+def record_usage(response, images):
+    usage = getattr(response, 'usage', None)
+    if usage:
+        metrics.inc('openai_tokens', usage.prompt_tokens, kind='prompt')
+        metrics.inc('openai_tokens', usage.completion_tokens, kind='completion')
+    metrics.inc('openai_images', images)
+
+def invalid_image_url(image_url):
+    return not isinstance(image_url, str) or not image_url
+
+def process_single_image(image_url, deadline=None):
+    if invalid_image_url(image_url):
+        return {"image_url": image_url, "error": "image_url must be a non-empty string"}
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": CLASSIFICATION_PROMPT},
-                    {"type": "image_url", "image_url": {"url": image_url}},
-                ],
-            }],
-        )
+        client = classification_client(deadline)
+        metrics.inc('openai_calls', mode='single')
+        with metrics.span('openai_classification'):
+            response = client.chat.completions.create(
+                model=ANALYSIS_CONFIG['model'],
+                messages=[{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": CLASSIFICATION_PROMPT},
+                        image_content(image_url, deadline),
+                    ],
+                }],
+            )
+        record_usage(response, 1)
         return {
             "image_url": image_url,
             "analysis": json.loads(response.choices[0].message.content)
         }
     except Exception as e:
+        metrics.inc('openai_errors')
         return {"image_url": image_url, "error": str(e)}
 
+def parse_batch_response(content, count):
+    # Returns {index: analysis} for every well-formed result; anything
+    # missing, duplicated or out of range is left for the single-image path.
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != BATCH_PROMPT_VERSION or not isinstance(data.get('results'), list):
+        return {}
+
+    analyses = {}
+    for result in data['results']:
+        if not isinstance(result, dict):
+            continue
+        index = result.get('index')
+        if not isinstance(index, int) or not 0 <= index < count or index in analyses:
+            continue
+        if isinstance(result.get('predictions'), list):
+            analyses[index] = {"predictions": result['predictions']}
+        elif isinstance(result.get('error'), str):
+            analyses[index] = {"error": result['error']}
+    return analyses
+
+def process_image_batch(image_urls, deadline=None):
+    # Invalid entries get their own error instead of failing the batch.
+    invalid = [index for index, image_url in enumerate(image_urls) if invalid_image_url(image_url)]
+    if invalid:
+        valid = [image_url for image_url in image_urls if not invalid_image_url(image_url)]
+        results = iter(process_image_batch(valid, deadline) if valid else [])
+        return [process_single_image(image_url) if index in invalid else next(results)
+                for index, image_url in enumerate(image_urls)]
+
+    if len(image_urls) == 1:
+        return [process_single_image(image_urls[0], deadline)]
+
+    content = [{"type": "text", "text": BATCH_CLASSIFICATION_PROMPT.format(count=len(image_urls), last=len(image_urls) - 1)}]
+    for index, image_part in enumerate(image_contents(image_urls, deadline)):
+        content.append({"type": "text", "text": f"Image {index}:"})
+        content.append(image_part)
+
+    analyses = {}
+    try:
+        client = classification_client(deadline)
+        metrics.inc('openai_calls', mode='batch')
+        with metrics.span('openai_batch_classification'):
+            response = client.chat.completions.create(
+                model=ANALYSIS_CONFIG['model'],
+                messages=[{"role": "user", "content": content}],
+                response_format={"type": "json_object"},
+            )
+        record_usage(response, len(image_urls))
+        analyses = parse_batch_response(response.choices[0].message.content, len(image_urls))
+    except DeadlineExceeded as e:
+        metrics.inc('openai_errors')
+        return [{"image_url": image_url, "error": str(e)} for image_url in image_urls]
+    except Exception as e:
+        metrics.inc('openai_errors')
+        print(f"Batch classification failed, falling back to single images: {e}")
+
+    results = []
+    for index, image_url in enumerate(image_urls):
+        if index in analyses:
+            results.append({"image_url": image_url, "analysis": analyses[index]})
+        else:
+            metrics.inc('openai_batch_fallbacks')
+            results.append(process_single_image(image_url, deadline))
+    return results
+
+def analyze_until_deadline(image_urls, deadline):
+    # Batches still queued when the deadline passes are cancelled; calls that
+    # are already running are bounded by their own timeout.
+    size = max(1, ANALYSIS_CONFIG['batch_size']) if ANALYSIS_CONFIG['batching'] else 1
+    batches = [image_urls[i:i + size] for i in range(0, len(image_urls), size)]
+    futures = [analysis_executor.submit(process_image_batch, batch, deadline) for batch in batches]
+    concurrent.futures.wait(futures, timeout=deadline.remaining())
+
+    results = []
+    partial = False
+    for batch, future in zip(batches, futures):
+        if future.done() and not future.cancelled():
+            results.extend(future.result())
+        else:
+            future.cancel()
+            partial = True
+            results.extend({"image_url": image_url, "error": "Deadline exceeded"} for image_url in batch)
+    return results, partial
+
+def remove_backgrounds(items, is_url, return_base64, deadline):
+    # Processes items in order until the deadline passes; the rest are
+    # reported as skipped instead of failing the whole request.
+    results = {}
+    for index, item in enumerate(items):
+        try:
+            if deadline.expired():
+                raise DeadlineExceeded()
+            filename, result = process_and_upload_image(
+                item,
+                bucket_name="haider-bhai",
+                is_url=is_url,
+                return_base64=return_base64,
+                deadline=deadline
+            )
+        except DeadlineExceeded:
+            metrics.inc('deadline_exceeded', endpoint='remove_background')
+            skipped = [item if is_url else item.filename for item in items[index:]]
+            return results, skipped
+        results[filename] = result
+    return results, []
+
+def background_response(results, skipped):
+    if not results and skipped:
+        return jsonify({"success": False, "error": "Deadline exceeded", "skipped": skipped}), 504
+    body = {"success": True, "results": results}
+    if skipped:
+        body.update(partial=True, skipped=skipped)
+    return jsonify(body)
+
+def analysis_batch_size(request):
+    # Runs before the view; malformed bodies count as one item and are
+    # rejected by the view itself.
+    data = request.get_json(silent=True)
+    image_urls = data.get('image_urls') if isinstance(data, dict) else None
+    return len(image_urls) if isinstance(image_urls, list) else 1
+
+def background_batch_size(request):
+    if request.is_json:
+        data = request.get_json(silent=True)
+        urls = data.get('urls') if isinstance(data, dict) else None
+        return len(urls) if isinstance(urls, list) else 1
+    if 'images' in request.files:
+        return len(request.files.getlist('images'))
+    return 1
+
 def setup_image_routes(app):
     @app.route('/analyze-image', methods=['POST'])
+    @admission_control('analyze_image')
     def analyze_image():
         try:
             data = request.json
             image_url = data.get('image_url')
-            return jsonify(process_single_image(image_url))
+            return jsonify(process_single_image(image_url, g.deadline))
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
     @app.route('/analyze-images', methods=['POST'])
+    @admission_control('analyze_images', analysis_batch_size)
     def analyze_images():
         try:
             data = request.json
@@ -126,87 +317,51 @@ def setup_image_routes(app):
             
             if not image_urls:
                 return jsonify({"error": "No images provided"}), 400
+            if not isinstance(image_urls, list):
+                return jsonify({"error": "image_urls must be a list"}), 400
 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                results = list(executor.map(process_single_image, image_urls))
+            results, partial = analyze_until_deadline(image_urls, g.deadline)
+            if partial:
+                metrics.inc('deadline_exceeded', endpoint='analyze_images')
+                return jsonify({"results": results, "partial": True})
 
             return jsonify({"results": results})
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
     @app.route('/remove-background', methods=['GET', 'POST'])
+    @admission_control('remove_background', background_batch_size)
     def remove_background():
         try:
             return_base64 = request.args.get('return_base64', 'false').lower() == 'true'
-            results = {}
 
             if request.is_json:
                 data = request.get_json()
+                if not isinstance(data, dict):
+                    return jsonify({"error": "No images or URLs provided"}), 400
                 if 'urls' in data:
                     # Handle multiple URLs
-                    urls = data.get('urls', [])
-                    for url in urls:
-                        if url:
-                            filename, result = process_and_upload_image(
-                                url,
-                                bucket_name="haider-bhai",
-                                is_url=True,
-                                return_base64=return_base64
-                            )
-                            results[filename] = result
-                    
-                    return jsonify({
-                        "success": True,
-                        "results": results
-                    })
+                    if not isinstance(data['urls'], list):
+                        return jsonify({"error": "urls must be a list"}), 400
+                    urls = [url for url in data['urls'] if url]
+                    return background_response(*remove_backgrounds(urls, True, return_base64, g.deadline))
                 
                 elif 'image_url' in data:
                     # Handle single URL from JSON body
                     image_url = data.get('image_url')
-                    filename, result = process_and_upload_image(
-                        image_url,
-                        bucket_name="haider-bhai",
-                        is_url=True,
-                        return_base64=return_base64
-                    )
-                    results[filename] = result
-                    return jsonify({
-                        "success": True,
-                        "results": results
-                    })
+                    return background_response(*remove_backgrounds([image_url], True, return_base64, g.deadline))
+
+                return jsonify({"error": "No images or URLs provided"}), 400
 
             elif 'images' in request.files:
                 # Handle file uploads
-                files = request.files.getlist('images')
-                for file in files:
-                    if file:
-                        filename, result = process_and_upload_image(
-                            file,
-                            bucket_name="haider-bhai",
-                            is_url=False,
-                            return_base64=return_base64
-                        )
-                        results[filename] = result
-                
-                return jsonify({
-                    "success": True,
-                    "results": results
-                })
+                files = [file for file in request.files.getlist('images') if file]
+                return background_response(*remove_backgrounds(files, False, return_base64, g.deadline))
             
             elif 'image_url' in request.args:
                 # Handle single URL from query params
                 image_url = request.args.get('image_url')
-                filename, result = process_and_upload_image(
-                    image_url,
-                    bucket_name="haider-bhai",
-                    is_url=True,
-                    return_base64=return_base64
-                )
-                results[filename] = result
-                return jsonify({
-                    "success": True,
-                    "results": results
-                })
+                return background_response(*remove_backgrounds([image_url], True, return_base64, g.deadline))
             
             else:
                 return jsonify({"error": "No images or URLs provided"}), 400
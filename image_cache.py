@@ -0,0 +1,213 @@
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+from config import DERIVATIVES_CONFIG, IMAGE_PROXY_CONFIG, S3_CONFIG
+from metrics import metrics
+from storage import CatalogBackend
+
+class ImageCache:
+    def __init__(self, cache_dir, max_bytes, revalidate_seconds=300):
+        # Entries are files named by a hash of the catalog key plus a hash of
+        # the source version, so a changed object gets a new file and ETag.
+        # The LRU order lives in memory and is rebuilt from file access times
+        # on start; `current` maps each key hash to its newest entry and when
+        # that entry's version was last checked.
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.entries = OrderedDict()
+        self.current = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.inflight = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+        files = []
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+            # Versions found on disk are checked again on first use.
+            self.current[name.split('-')[0]] = (name, float('-inf'))
+        self._evict()
+
+    def _key_hash(self, key):
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _name(self, key, version):
+        version_hash = hashlib.sha1(version.encode()).hexdigest()[:16]
+        return f"{self._key_hash(key)}-{version_hash}{os.path.splitext(key)[1]}"
+
+    def _remove(self, name):
+        size = self.entries.pop(name, None)
+        if size is None:
+            return
+        self.total_bytes -= size
+        key_hash = name.split('-')[0]
+        if self.current.get(key_hash, (None,))[0] == name:
+            del self.current[key_hash]
+        try:
+            os.unlink(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        # The newest entry is kept even if it alone exceeds the budget, so
+        # the request that just fetched it can still be served.
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+            metrics.inc('image_cache_evictions')
+
+    def _hit(self, name):
+        self.entries.move_to_end(name)
+        metrics.inc('image_cache_lookups', result='hit')
+        return os.path.join(self.cache_dir, name), self.entries[name], name
+
+    def get(self, key, catalog):
+        # Returns (path, size, etag). Concurrent misses for the same object
+        # wait for one download instead of each fetching it.
+        key_hash = self._key_hash(key)
+        with self.lock:
+            name, checked_at = self.current.get(key_hash, (None, None))
+            if name in self.entries and time.monotonic() - checked_at < self.revalidate_seconds:
+                return self._hit(name)
+
+        with metrics.span('image_cache_revalidate'):
+            version = catalog.object_version(key)
+        name = self._name(key, version)
+        path = os.path.join(self.cache_dir, name)
+        while True:
+            with self.lock:
+                if name in self.entries:
+                    previous = self.current.get(key_hash, (None,))[0]
+                    self.current[key_hash] = (name, time.monotonic())
+                    if previous not in (None, name):
+                        self._remove(previous)
+                    return self._hit(name)
+                event = self.inflight.get(name)
+                if event is None:
+                    event = self.inflight[name] = threading.Event()
+                    break
+            event.wait()
+
+        metrics.inc('image_cache_lookups', result='miss')
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with metrics.span('image_cache_fill'):
+                catalog.download_object(key, tmp_path)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+            with self.lock:
+                previous = self.current.get(key_hash, (None,))[0]
+                if previous not in (None, name):
+                    # The source changed; the old copy is never served again.
+                    self._remove(previous)
+                self.entries[name] = size
+                self.total_bytes += size
+                self.current[key_hash] = (name, time.monotonic())
+                self._evict()
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(name).set()
+        return path, size, name
+
+    def discard(self, key):
+        # Forgets the key's entry, e.g. after its file was evicted between
+        # lookup and serving, so the next get fills it again.
+        with self.lock:
+            name = self.current.get(self._key_hash(key), (None,))[0]
+            if name:
+                self._remove(name)
+
+    def usage(self):
+        with self.lock:
+            return len(self.entries), self.total_bytes
+
+class ProxiedCatalog(CatalogBackend):
+    # Hands out URLs to the quiz service's image route instead of the
+    # backend's own (presigned) URLs; listing and storage are unchanged.
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_available_images(self, gender):
+        return self.backend.get_available_images(gender)
+
+    def get_image_url(self, image_key):
+        return f"{IMAGE_PROXY_CONFIG['base_url'].rstrip('/')}{IMAGE_PROXY_CONFIG['route']}/{quote(image_key)}"
+
+    def read_object(self, key):
+        return self.backend.read_object(key)
+
+    def write_object(self, key, data, content_type):
+        return self.backend.write_object(key, data, content_type)
+
+    def download_object(self, key, path):
+        return self.backend.download_object(key, path)
+
+    def object_version(self, key):
+        return self.backend.object_version(key)
+
+def is_servable_key(image_key):
+    return (image_key.startswith((S3_CONFIG['prefix'], DERIVATIVES_CONFIG['prefix']))
+            and '..' not in image_key.split('/'))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_image_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache(IMAGE_PROXY_CONFIG['cache_dir'], IMAGE_PROXY_CONFIG['max_bytes'],
+                                IMAGE_PROXY_CONFIG['revalidate_seconds'])
+            metrics.register_gauge('image_cache_bytes', lambda: _cache.usage()[1])
+            metrics.register_gauge('image_cache_entries', lambda: _cache.usage()[0])
+        return _cache
+
+def setup_image_proxy_routes(app):
+    from flask import jsonify, send_file
+    from storage import create_catalog
+
+    cache = get_image_cache()
+    catalog = create_catalog(proxied=False)
+    app.config['USE_X_SENDFILE'] = IMAGE_PROXY_CONFIG['x_sendfile']
+
+    @app.route(f"{IMAGE_PROXY_CONFIG['route']}/<path:image_key>", methods=['GET'])
+    def proxy_image(image_key):
+        if not is_servable_key(image_key):
+            return jsonify({'error': 'Invalid image key'}), 404
+
+        # A file can be evicted by another request between the lookup and
+        # send_file opening it; that lookup is simply repeated.
+        for _ in range(2):
+            try:
+                path, _, etag = cache.get(image_key, catalog)
+            except Exception as e:
+                print(f"Error fetching {image_key}: {e}")
+                return jsonify({'error': 'Image not found'}), 404
+
+            # send_file handles If-None-Match and Range; cache hits are served
+            # through wsgi.file_wrapper (sendfile under gunicorn) or X-Sendfile.
+            try:
+                return send_file(
+                    path,
+                    mimetype=mimetypes.guess_type(image_key)[0],
+                    conditional=True,
+                    etag=etag,
+                    max_age=IMAGE_PROXY_CONFIG['max_age']
+                )
+            except FileNotFoundError:
+                metrics.inc('image_cache_races')
+                cache.discard(image_key)
+        return jsonify({'error': 'Image not found'}), 404
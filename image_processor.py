@@ -1,5 +1,3 @@
-from rembg import remove
-from PIL import Image
 import os
 import tempfile
 import requests
@@ -7,10 +5,12 @@ from urllib.parse import urlparse
 import base64
 from io import BytesIO
 from typing import Tuple
+from config import DEADLINE_CONFIG
+from deadlines import call_timeout
 from s3_operations import upload_to_s3
 
-def download_image(url: str) -> tuple:
-    response = requests.get(url)
+def download_image(url: str, deadline=None) -> tuple:
+    response = requests.get(url, timeout=call_timeout(deadline, DEADLINE_CONFIG['download_timeout']))
     if response.status_code != 200:
         raise Exception(f"Failed to download image from {url}")
     
@@ -21,19 +21,26 @@ def download_image(url: str) -> tuple:
     
     return tmp.name, filename
 
-def process_and_upload_image(input_data, bucket_name: str, is_url: bool = False, return_base64: bool = False) -> Tuple[str, str]:
+def process_and_upload_image(input_data, bucket_name: str, is_url: bool = False, return_base64: bool = False, deadline=None) -> Tuple[str, str]:
     temp_path = None
     temp_output_path = None
     
     try:
         if is_url:
-            temp_path, filename = download_image(input_data)
+            temp_path, filename = download_image(input_data, deadline)
         else:
             temp_path = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(input_data.filename)[1]).name
             input_data.save(temp_path)
             filename = input_data.filename
         
+        # rembg pulls in onnxruntime and its model on import, so it is only
+        # loaded once a background removal is actually requested.
+        from PIL import Image
+        from rembg import remove
+
         image = Image.open(temp_path)
+        if deadline:
+            deadline.check('background removal')
         output_image = remove(image)
         
         if return_base64:
@@ -46,7 +53,7 @@ def process_and_upload_image(input_data, bucket_name: str, is_url: bool = False,
         temp_output_path = tempfile.NamedTemporaryFile(delete=False, suffix='.png').name
         output_image.save(temp_output_path)
         
-        s3_url = upload_to_s3(temp_output_path, bucket_name, output_filename)
+        s3_url = upload_to_s3(temp_output_path, bucket_name, output_filename, deadline)
         
         return filename, s3_url
         
@@ -0,0 +1,105 @@
+import base64
+import threading
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+from config import ANALYSIS_CONFIG, DEADLINE_CONFIG
+from deadlines import call_timeout
+from metrics import metrics
+
+class PayloadCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            payload = self.entries.get(key)
+            if payload is not None:
+                self.entries.move_to_end(key)
+            return payload
+
+    def put(self, key, payload):
+        with self.lock:
+            self.entries[key] = payload
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+payload_cache = PayloadCache(ANALYSIS_CONFIG['inline_cache_entries'])
+# Separate from the analysis pool, whose threads wait on these fetches.
+fetch_executor = ThreadPoolExecutor(max_workers=ANALYSIS_CONFIG['inline_fetch_threads'], thread_name_prefix='inline-fetch')
+metrics.register_gauge('inline_payload_cache_entries', lambda: len(payload_cache))
+
+def payload_cache_key(image_url):
+    # Presigned URLs change on every request for the same object, so the
+    # signature is left out of the key.
+    parsed = urlparse(image_url)
+    if 'X-Amz-Signature' in parse_qs(parsed.query):
+        return f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+    return image_url
+
+def downscale(data, max_edge, fmt, quality):
+    from PIL import Image, ImageOps
+
+    image = Image.open(BytesIO(data))
+    # JPEG can decode straight to a reduced size, which is much cheaper than
+    # decoding the full image and resizing it.
+    image.draft('RGB', (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def prepare_image(image_url, deadline=None):
+    # Returns a data URL for the downscaled image, from the cache when the
+    # same object was prepared before.
+    key = payload_cache_key(image_url)
+    payload = payload_cache.get(key)
+    if payload is not None:
+        metrics.inc('inline_payload_lookups', result='hit')
+        return payload
+    metrics.inc('inline_payload_lookups', result='miss')
+
+    # Client-supplied URLs are only fetched over HTTP(S).
+    if urlparse(image_url).scheme not in ('http', 'https'):
+        raise ValueError(f"Unsupported URL scheme: {image_url}")
+
+    with metrics.span('inline_image_fetch'):
+        response = requests.get(image_url, timeout=call_timeout(deadline, DEADLINE_CONFIG['download_timeout']))
+        response.raise_for_status()
+    with metrics.span('inline_image_encode'):
+        fmt = ANALYSIS_CONFIG['inline_format']
+        data = downscale(response.content, ANALYSIS_CONFIG['inline_max_edge'], fmt, ANALYSIS_CONFIG['inline_quality'])
+
+    payload = f"data:image/{fmt};base64,{base64.b64encode(data).decode()}"
+    metrics.inc('inline_image_bytes', len(response.content), stage='fetched')
+    metrics.inc('inline_image_bytes', len(data), stage='sent')
+    payload_cache.put(key, payload)
+    return payload
+
+def image_content(image_url, deadline=None):
+    # Message part for one image. Anything that cannot be fetched or decoded
+    # here is still sent by URL so the provider gets a chance to read it.
+    if not ANALYSIS_CONFIG['inline_images'] or image_url.startswith('data:'):
+        return {"type": "image_url", "image_url": {"url": image_url}}
+    try:
+        payload = prepare_image(image_url, deadline)
+    except Exception as e:
+        metrics.inc('inline_image_errors')
+        print(f"Error inlining {image_url}: {e}")
+        return {"type": "image_url", "image_url": {"url": image_url}}
+    return {"type": "image_url", "image_url": {"url": payload, "detail": ANALYSIS_CONFIG['inline_detail']}}
+
+def image_contents(image_urls, deadline=None):
+    if not ANALYSIS_CONFIG['inline_images'] or len(image_urls) == 1:
+        return [image_content(image_url, deadline) for image_url in image_urls]
+    return list(fetch_executor.map(lambda image_url: image_content(image_url, deadline), image_urls))
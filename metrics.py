@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from config import METRICS_CONFIG
+
+PREFIX = 'ethos_'
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True, sample_rate=1.0, buckets=None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.buckets = tuple(buckets or METRICS_CONFIG['buckets'])
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.gauge_callbacks = {}
+        self.histograms = {}
+
+    def span(self, name, **labels):
+        # Disabled or unsampled spans share one no-op context manager so the
+        # instrumented call sites cost a single attribute check.
+        if not self.enabled or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return _NULL_SPAN
+        return _Span(self, name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def set_gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def register_gauge(self, name, callback):
+        self.gauge_callbacks[name] = callback
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram(self.buckets)
+            histogram.counts[bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {
+                key: (list(h.counts), h.sum, h.count)
+                for key, h in self.histograms.items()
+            }
+        gauges = dict(self.gauges)
+        for name, callback in self.gauge_callbacks.items():
+            try:
+                gauges[name] = callback()
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+
+        lines = []
+        seen = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{PREFIX}{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        for name, value in sorted(gauges.items()):
+            metric = f"{PREFIX}{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            metric = f"{PREFIX}{name}_seconds"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} histogram")
+                seen.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+metrics = MetricsRegistry(
+    enabled=METRICS_CONFIG['enabled'],
+    sample_rate=METRICS_CONFIG['sample_rate']
+)
+
+
+def setup_metrics_routes(app):
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_request_timer():
+        if metrics.enabled:
+            g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_duration(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unknown'
+            metrics.observe('http_request', time.perf_counter() - start, (('endpoint', endpoint),))
+            metrics.inc('http_requests', endpoint=endpoint, status=response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,146 @@
+import argparse
+import ast
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from sqlite_store import SQLiteStore
+
+class ProfileStore(SQLiteStore):
+    def __init__(self, db_path, cache_size=1024):
+        super().__init__(db_path)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    preference_id TEXT PRIMARY KEY,
+                    top_styles TEXT NOT NULL,
+                    selection_history TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _cache_put(self, preference_id, profile):
+        with self.cache_lock:
+            self.cache[preference_id] = profile
+            self.cache.move_to_end(preference_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def save(self, preference_id, top_styles, selection_history):
+        updated_at = time.time()
+        with self._connection() as conn:
+            conn.execute("""
+                INSERT INTO profiles (preference_id, top_styles, selection_history, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(preference_id) DO UPDATE SET
+                    top_styles = excluded.top_styles,
+                    selection_history = excluded.selection_history,
+                    updated_at = excluded.updated_at
+            """, (preference_id, json.dumps(top_styles), json.dumps(selection_history), updated_at))
+        # Copies, so later changes to the session's lists cannot make the
+        # cache (and the ETag built from updated_at) disagree with the row.
+        self._cache_put(preference_id, {
+            'top_styles': dict(top_styles),
+            'selection_history': list(selection_history),
+            'updated_at': updated_at
+        })
+
+    def get(self, preference_id):
+        with self.cache_lock:
+            profile = self.cache.get(preference_id)
+            if profile is not None:
+                self.cache.move_to_end(preference_id)
+                return profile
+
+        row = self._connection().execute(
+            "SELECT top_styles, selection_history, updated_at FROM profiles WHERE preference_id = ?",
+            (preference_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        profile = {
+            'top_styles': json.loads(row[0]),
+            'selection_history': json.loads(row[1]),
+            'updated_at': row[2]
+        }
+        self._cache_put(preference_id, profile)
+        return profile
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def iter_profiles(self, batch_size=500):
+        cursor = self._connection().execute(
+            "SELECT preference_id, top_styles, selection_history FROM profiles ORDER BY rowid"
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for preference_id, top_styles, selection_history in rows:
+                yield preference_id, json.loads(top_styles), json.loads(selection_history)
+
+    def migrate_from_csv(self, csv_path):
+        skipped = 0
+        csv.field_size_limit(sys.maxsize)
+        with open(csv_path, newline='') as f:
+            rows = []
+            for row in csv.DictReader(f):
+                try:
+                    top_styles = _parse_cell(row['top_styles'])
+                    selection_history = _parse_cell(row['selection_history'])
+                except (ValueError, SyntaxError):
+                    skipped += 1
+                    continue
+                rows.append((row['preference_id'], json.dumps(top_styles), json.dumps(selection_history), time.time()))
+
+        with self._connection() as conn:
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT INTO profiles (preference_id, top_styles, selection_history, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(preference_id) DO NOTHING
+            """, rows)
+            migrated = conn.total_changes - before
+
+        with self.cache_lock:
+            self.cache.clear()
+        return migrated, skipped
+
+def _parse_cell(value):
+    # Older rows were written with json.dumps, but some were stringified
+    # Python objects; literal_eval handles those without quote rewriting.
+    if not value:
+        return {}
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return ast.literal_eval(value)
+
+def main():
+    from style_algorithm import PROFILES_CSV, profile_store
+
+    parser = argparse.ArgumentParser(description="Profile store maintenance")
+    parser.add_argument('command', choices=['migrate', 'count'])
+    parser.add_argument('--csv', default=PROFILES_CSV, help="profiles.csv to import")
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        if not os.path.exists(args.csv):
+            print(f"{args.csv} does not exist")
+            return
+        migrated, skipped = profile_store.migrate_from_csv(args.csv)
+        print(f"Migrated {migrated} profiles ({skipped} unreadable rows skipped)")
+    else:
+        print(f"{profile_store.count()} profiles in {profile_store.db_path}")
+
+if __name__ == "__main__":
+    main()
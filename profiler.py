@@ -0,0 +1,161 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import uuid
+from config import PROFILING_CONFIG
+
+
+class RequestProfiler:
+    def __init__(self, config):
+        self.config = config
+        self.output_dir = config['output_dir']
+        os.makedirs(self.output_dir, exist_ok=True)
+        # cProfile hooks are per interpreter, so at most one request is
+        # captured at a time; everything else runs unprofiled.
+        self.capture_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.armed = []
+        self.last_capture = 0.0
+
+    def is_admin(self, token):
+        return bool(self.config['admin_token']) and token == self.config['admin_token']
+
+    def arm(self, count, path_prefix=None):
+        count = max(1, min(int(count), self.config['max_armed']))
+        with self.state_lock:
+            self.armed = [path_prefix] * count
+        return count
+
+    def should_profile(self, path, header_token):
+        if not any(path.startswith(p) for p in self.config['path_prefixes']):
+            return False
+
+        with self.state_lock:
+            requested = self.is_admin(header_token)
+            armed_index = None
+            if not requested:
+                for idx, prefix in enumerate(self.armed):
+                    if prefix is None or path.startswith(prefix):
+                        armed_index = idx
+                        break
+                if armed_index is None:
+                    return False
+
+            now = time.time()
+            if now - self.last_capture < self.config['min_interval_seconds']:
+                return False
+            if not self.capture_lock.acquire(blocking=False):
+                return False
+
+            self.last_capture = now
+            if armed_index is not None:
+                del self.armed[armed_index]
+            return True
+
+    def start(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile, profile_id, path, duration):
+        try:
+            profile.disable()
+            base = os.path.join(self.output_dir, profile_id)
+            profile.dump_stats(base + '.prof')
+
+            summary = io.StringIO()
+            summary.write(f"{path} took {duration * 1000:.1f} ms\n\n")
+            pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(50)
+            with open(base + '.txt', 'w') as f:
+                f.write(summary.getvalue())
+
+            self.prune()
+        except Exception as e:
+            print(f"Error saving profile {profile_id}: {e}")
+        finally:
+            self.capture_lock.release()
+
+    def prune(self):
+        profiles = self.list_profiles()
+        for entry in profiles[self.config['max_profiles']:]:
+            for ext in ('.prof', '.txt'):
+                path = os.path.join(self.output_dir, entry['profile_id'] + ext)
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def list_profiles(self):
+        profiles = []
+        for name in os.listdir(self.output_dir):
+            if not name.endswith('.prof'):
+                continue
+            path = os.path.join(self.output_dir, name)
+            profiles.append({
+                'profile_id': name[:-len('.prof')],
+                'created': os.path.getmtime(path),
+                'size': os.path.getsize(path)
+            })
+        return sorted(profiles, key=lambda p: p['created'], reverse=True)
+
+
+def setup_profiling(app):
+    from flask import g, jsonify, request, send_from_directory
+
+    profiler = RequestProfiler(PROFILING_CONFIG)
+
+    @app.before_request
+    def start_profiling():
+        if profiler.should_profile(request.path, request.headers.get(PROFILING_CONFIG['header'])):
+            g.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            g.profile_start = time.perf_counter()
+            g.profile = profiler.start()
+
+    @app.after_request
+    def tag_profiled_response(response):
+        if 'profile_id' in g:
+            response.headers['X-Profile-Id'] = g.profile_id
+        return response
+
+    @app.teardown_request
+    def finish_profiling(exc):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            duration = time.perf_counter() - g.pop('profile_start')
+            profiler.finish(profile, g.profile_id, request.path, duration)
+
+    @app.route('/admin/profiling/arm', methods=['POST'])
+    def arm_profiling():
+        if not profiler.is_admin(request.headers.get('X-Admin-Token')):
+            return jsonify({'error': 'Invalid admin token'}), 401
+
+        data = request.get_json(silent=True) or {}
+        try:
+            count = profiler.arm(data.get('count', 1), data.get('path_prefix'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid parameters'}), 400
+
+        return jsonify({'armed': count})
+
+    @app.route('/admin/profiling/profiles', methods=['GET'])
+    def list_profiles():
+        if not profiler.is_admin(request.headers.get('X-Admin-Token')):
+            return jsonify({'error': 'Invalid admin token'}), 401
+        return jsonify({'profiles': profiler.list_profiles()})
+
+    @app.route('/admin/profiling/profiles/<profile_id>', methods=['GET'])
+    def download_profile(profile_id):
+        if not profiler.is_admin(request.headers.get('X-Admin-Token')):
+            return jsonify({'error': 'Invalid admin token'}), 401
+
+        fmt = request.args.get('format', 'prof')
+        if fmt not in ('prof', 'txt'):
+            return jsonify({'error': 'Invalid format'}), 400
+
+        filename = f"{profile_id}.{fmt}"
+        if not os.path.exists(os.path.join(profiler.output_dir, filename)):
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_from_directory(profiler.output_dir, filename, as_attachment=True)
+
+    return profiler
@@ -0,0 +1,133 @@
+import gzip
+from config import RESPONSE_CONFIG
+from metrics import metrics
+
+def load_orjson():
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+def load_brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def make_json_provider_class(orjson):
+    from flask.json.provider import DefaultJSONProvider
+
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def default(obj):
+        # numpy scalars from the pandas frames and anything Flask's encoder
+        # already knows (dates, UUIDs, dataclasses, Decimal).
+        if hasattr(obj, 'item'):
+            return obj.item()
+        return DefaultJSONProvider.default(obj)
+
+    class FastJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return orjson.dumps(obj, default=default, option=options).decode()
+
+        def loads(self, s, **kwargs):
+            if kwargs:
+                return super().loads(s, **kwargs)
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            option = options
+            if self.compact is False or (self.compact is None and self._app.debug):
+                option |= orjson.OPT_INDENT_2
+            return self._app.response_class(
+                orjson.dumps(obj, default=default, option=option),
+                mimetype=self.mimetype
+            )
+
+    return FastJSONProvider
+
+def accepted_encodings(header):
+    encodings = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+def choose_encoding(header, brotli):
+    encodings = accepted_encodings(header)
+
+    def accepted(name):
+        # A listed encoding's own q wins over '*', so "gzip;q=0, *" refuses gzip.
+        return encodings.get(name, encodings.get('*', 0.0)) > 0
+
+    if brotli and accepted('br'):
+        return 'br'
+    if accepted('gzip'):
+        return 'gzip'
+    return None
+
+def compress(data, encoding, brotli=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=RESPONSE_CONFIG['brotli_quality'])
+    return gzip.compress(data, compresslevel=RESPONSE_CONFIG['gzip_level'], mtime=0)
+
+def setup_response_encoding(app):
+    from flask import request
+
+    orjson = load_orjson() if RESPONSE_CONFIG['json_provider'] == 'orjson' else None
+    if orjson:
+        app.json_provider_class = make_json_provider_class(orjson)
+        app.json = app.json_provider_class(app)
+    elif RESPONSE_CONFIG['json_provider'] == 'orjson':
+        print("orjson is not installed, using the default JSON provider")
+
+    if not RESPONSE_CONFIG['compression']:
+        return
+
+    brotli = load_brotli()
+    mimetypes = RESPONSE_CONFIG['mimetypes']
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in mimetypes):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'), brotli)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < RESPONSE_CONFIG['min_size']:
+            return response
+
+        with metrics.span('response_compress', encoding=encoding):
+            compressed = compress(data, encoding, brotli)
+        if len(compressed) >= len(data):
+            return response
+
+        metrics.inc('response_bytes_saved', len(data) - len(compressed), encoding=encoding)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # The representation changed, so a strong validator would be wrong.
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response.headers['ETag'] = f"W/{etag}"
+        return response
@@ -1,46 +1,93 @@
 import boto3
 from botocore.exceptions import ClientError
 from collections import defaultdict
+from catalog_manifest import open_manifest
 from config import S3_CONFIG
+from metrics import metrics
+from s3_operations import s3_client_config
+from storage import CatalogBackend
 import os
 from dotenv import load_dotenv
 load_dotenv()
-class S3Handler:
+class S3Handler(CatalogBackend):
     def __init__(self):
-        self.s3_client = boto3.client('s3', **{
+        self.s3_client = boto3.client('s3', config=s3_client_config(), **{
             k: v for k, v in S3_CONFIG.items() 
             if k.startswith('aws_')
         })
         self.bucket_name = S3_CONFIG['bucket_name']
         self.prefix = S3_CONFIG['prefix']
+        self.manifest = None
+        if os.path.exists(S3_CONFIG['catalog_manifest']):
+            self.manifest = open_manifest(S3_CONFIG['catalog_manifest'], S3_CONFIG['catalog_refresh_seconds'])
 
     def get_available_images(self, gender):
+        if self.manifest:
+            images = self.manifest.images_by_style(gender)
+            if images:
+                return defaultdict(list, images)
+
         images_by_style = defaultdict(list)
         try:
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            pages = paginator.paginate(Bucket=self.bucket_name, Prefix=self.prefix)
-            
-            for page in pages:
-                if 'Contents' in page:
+            with metrics.span('s3_list_images'):
+                paginator = self.s3_client.get_paginator('list_objects_v2')
+                pages = paginator.paginate(Bucket=self.bucket_name, Prefix=self.prefix)
+
+                for page in pages:
+                    metrics.inc('s3_calls', operation='list_objects_v2')
+                    if 'Contents' not in page:
+                        continue
                     for obj in page['Contents']:
                         key = obj['Key']
                         parts = key.split('/')
                         if len(parts) >= 4 and parts[1] == gender:
                             style = parts[2].replace('-style', '')
                             images_by_style[style].append(key)
-            
+
             return images_by_style
         except ClientError as e:
+            metrics.inc('s3_errors', operation='list_objects_v2')
             print(f"Error accessing S3: {e}")
             return {}
 
     def get_image_url(self, image_key):
         try:
-            return self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': self.bucket_name, 'Key': image_key},
-                ExpiresIn=3600
-            )
+            with metrics.span('s3_presign_url'):
+                metrics.inc('s3_presigned_urls')
+                return self.s3_client.generate_presigned_url(
+                    'get_object',
+                    Params={'Bucket': self.bucket_name, 'Key': image_key},
+                    ExpiresIn=3600
+                )
         except ClientError as e:
+            metrics.inc('s3_errors', operation='generate_presigned_url')
             print(f"Error generating URL: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def read_object(self, key):
+        with metrics.span('s3_get_object'):
+            metrics.inc('s3_calls', operation='get_object')
+            return self.s3_client.get_object(Bucket=self.bucket_name, Key=key)['Body'].read()
+
+    def write_object(self, key, data, content_type):
+        # Only used for generated variants, which change only when the
+        # derivatives job is re-run with --force.
+        with metrics.span('s3_put_object'):
+            metrics.inc('s3_calls', operation='put_object')
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=data,
+                ContentType=content_type,
+                CacheControl='public, max-age=2592000'
+            )
+
+    def download_object(self, key, path):
+        with metrics.span('s3_download_object'):
+            metrics.inc('s3_calls', operation='get_object')
+            self.s3_client.download_file(self.bucket_name, key, path)
+
+    def object_version(self, key):
+        with metrics.span('s3_head_object'):
+            metrics.inc('s3_calls', operation='head_object')
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=key)['ETag'].strip('"')
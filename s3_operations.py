@@ -1,17 +1,33 @@
+import os
 import boto3
+from botocore.config import Config
 from dotenv import load_dotenv
+from config import DEADLINE_CONFIG
+from deadlines import current_deadline
 
 load_dotenv()
+
+def s3_client_config():
+    return Config(
+        connect_timeout=DEADLINE_CONFIG['s3_connect_timeout'],
+        read_timeout=DEADLINE_CONFIG['s3_read_timeout'],
+        retries={'max_attempts': DEADLINE_CONFIG['s3_max_attempts'], 'mode': 'standard'}
+    )
+
 def get_s3_client():
     return boto3.client(
     's3',
     aws_access_key_id=os.getenv('aws_access_key_id'),
     aws_secret_access_key=os.getenv('aws_secret_access_key'),
     region_name='us-east-1',
-    verify=True
+    verify=True,
+    config=s3_client_config()
     )
 
-def upload_to_s3(file_path: str, bucket_name: str, output_filename: str) -> str:
+def upload_to_s3(file_path: str, bucket_name: str, output_filename: str, deadline=None) -> str:
+    deadline = deadline or current_deadline()
+    if deadline:
+        deadline.check('S3 upload')
     s3_client = get_s3_client()
     try:
         s3_client.upload_file(
@@ -22,4 +38,4 @@ def upload_to_s3(file_path: str, bucket_name: str, output_filename: str) -> str:
         )
         return f"https://{bucket_name}.s3.amazonaws.com/{output_filename}"
     except Exception as s3_error:
-        raise Exception(f"S3 upload failed: {str(s3_error)}")
\ No newline at end of file
+        raise Exception(f"S3 upload failed: {str(s3_error)}")
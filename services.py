@@ -0,0 +1,37 @@
+import argparse
+import os
+import shutil
+from config import SERVICES_CONFIG
+
+def create_service_app(service):
+    from style_algorithm import create_app
+    return create_app(services=(service,))
+
+def gunicorn_command(service):
+    service_config = SERVICES_CONFIG[service]
+    return [
+        'gunicorn',
+        '--workers', str(service_config['workers']),
+        '--threads', str(service_config['threads']),
+        '--timeout', str(service_config['timeout']),
+        '--bind', f"0.0.0.0:{service_config['port']}",
+        f"services:create_service_app('{service}')"
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one of the API services as its own process")
+    parser.add_argument('service', choices=['quiz', 'image'])
+    parser.add_argument('--dev', action='store_true', help="Use the Flask development server")
+    args = parser.parse_args()
+
+    if not args.dev and shutil.which('gunicorn'):
+        command = gunicorn_command(args.service)
+        print(f"Starting {args.service} service: {' '.join(command)}")
+        os.execvp(command[0], command)
+
+    service_config = SERVICES_CONFIG[args.service]
+    app = create_service_app(args.service)
+    app.run(host='0.0.0.0', port=service_config['port'], threaded=True)
+
+if __name__ == "__main__":
+    main()
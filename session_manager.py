@@ -0,0 +1,38 @@
+import threading
+
+class SessionManager:
+    def __init__(self, columns, stripes=64):
+        # Sessions are plain dicts keyed by preference_id. Work on a session
+        # runs under that session's stripe lock, so different sessions only
+        # contend when they hash to the same stripe; the registry lock only
+        # guards adding sessions and taking snapshots.
+        self.columns = columns
+        self.sessions = {}
+        self.registry_lock = threading.Lock()
+        self.stripes = [threading.RLock() for _ in range(stripes)]
+
+    def lock(self, preference_id):
+        return self.stripes[hash(preference_id) % len(self.stripes)]
+
+    def add(self, session):
+        with self.registry_lock:
+            self.sessions[session['preference_id']] = session
+
+    def load(self, records):
+        with self.registry_lock:
+            for record in records:
+                self.sessions[record['preference_id']] = {column: record.get(column) for column in self.columns}
+
+    def get(self, preference_id):
+        return self.sessions.get(preference_id)
+
+    def snapshot(self):
+        with self.registry_lock:
+            return [dict(session) for session in self.sessions.values()]
+
+    def active_count(self):
+        with self.registry_lock:
+            return sum(1 for session in self.sessions.values() if session['completed'] != True)
+
+    def __len__(self):
+        return len(self.sessions)
@@ -0,0 +1,36 @@
+import os
+import sqlite3
+import threading
+
+class SQLiteStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared across threads, so each
+        # worker thread keeps its own.
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def open_shared(store_class, db_path, *args, must_exist=False):
+    # One store (and its in-memory cache) per class and database per process.
+    # With must_exist, returns None until the file has been created.
+    key = (store_class, db_path)
+    store = _shared.get(key)
+    if store is None:
+        if must_exist and not os.path.exists(db_path):
+            return None
+        with _shared_lock:
+            store = _shared.get(key)
+            if store is None:
+                store = _shared[key] = store_class(db_path, *args)
+    return store
@@ -0,0 +1,123 @@
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from urllib.parse import quote
+from config import IMAGE_PROXY_CONFIG, S3_CONFIG, STORAGE_CONFIG
+from metrics import metrics
+
+class CatalogBackend(ABC):
+    # Keys always use the bucket layout, Styles/<gender>/<style>-style/<file>,
+    # whichever backend stores them.
+    @abstractmethod
+    def get_available_images(self, gender):
+        pass
+
+    @abstractmethod
+    def get_image_url(self, image_key):
+        pass
+
+    @abstractmethod
+    def read_object(self, key):
+        pass
+
+    @abstractmethod
+    def write_object(self, key, data, content_type):
+        pass
+
+    @abstractmethod
+    def download_object(self, key, path):
+        pass
+
+    @abstractmethod
+    def object_version(self, key):
+        # Changes whenever the object's content does (S3 ETag, local mtime).
+        pass
+
+class LocalCatalog(CatalogBackend):
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, root=None, base_url=None, refresh_seconds=None):
+        self.root = root or STORAGE_CONFIG['local_root']
+        self.base_url = (base_url if base_url is not None else STORAGE_CONFIG['local_base_url']).rstrip('/')
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else STORAGE_CONFIG['local_refresh_seconds']
+        self.prefix = S3_CONFIG['prefix']
+
+    def _scan(self, gender):
+        images_by_style = defaultdict(list)
+        gender_dir = os.path.join(self.root, self.prefix, gender)
+        if not os.path.isdir(gender_dir):
+            print(f"Local catalog directory {gender_dir} does not exist")
+            return images_by_style
+
+        with os.scandir(gender_dir) as styles:
+            for style_entry in styles:
+                if not style_entry.is_dir():
+                    continue
+                style = style_entry.name.replace('-style', '')
+                with os.scandir(style_entry.path) as files:
+                    for entry in files:
+                        if entry.is_file() and not entry.name.startswith('.'):
+                            images_by_style[style].append(f"{self.prefix}{gender}/{style_entry.name}/{entry.name}")
+                images_by_style[style].sort()
+        return images_by_style
+
+    def get_available_images(self, gender):
+        key = (self.root, gender)
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached and now - cached[0] < self.refresh_seconds:
+            metrics.inc('catalog_lookups', result='hit')
+            return defaultdict(list, cached[1])
+
+        metrics.inc('catalog_lookups', result='miss')
+        with metrics.span('local_list_images'):
+            images = dict(self._scan(gender))
+        with self._cache_lock:
+            self._cache[key] = (now, images)
+        return defaultdict(list, images)
+
+    def get_image_url(self, image_key):
+        return f"{self.base_url}{STORAGE_CONFIG['local_route']}/{quote(image_key)}"
+
+    def read_object(self, key):
+        with open(os.path.join(self.root, key), 'rb') as f:
+            return f.read()
+
+    def write_object(self, key, data, content_type):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def download_object(self, key, path):
+        shutil.copyfile(os.path.join(self.root, key), path)
+
+    def object_version(self, key):
+        stat = os.stat(os.path.join(self.root, key))
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+def create_catalog(proxied=True):
+    if STORAGE_CONFIG['backend'] == 'local':
+        backend = LocalCatalog()
+    else:
+        from s3_handler import S3Handler
+        backend = S3Handler()
+
+    if proxied and IMAGE_PROXY_CONFIG['enabled']:
+        from image_cache import ProxiedCatalog
+        return ProxiedCatalog(backend)
+    return backend
+
+def setup_local_image_routes(app):
+    from flask import send_from_directory
+
+    @app.route(f"{STORAGE_CONFIG['local_route']}/<path:image_key>", methods=['GET'])
+    def local_image(image_key):
+        return send_from_directory(STORAGE_CONFIG['local_root'], image_key, max_age=3600)
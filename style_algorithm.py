@@ -1,24 +1,39 @@
 from collections import defaultdict
+import atexit
+import hashlib
 import random
+import threading
 import time
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import pandas as pd
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from s3_handler import S3Handler
-from config import ALGORITHM_PARAMS
+from config import AGGREGATES_CONFIG, ALGORITHM_PARAMS, BATCH_CONFIG, IMAGE_STATS_CONFIG, PREFETCH_CONFIG, PRIORS_CONFIG, PROFILE_STORE_CONFIG, PROFILING_CONFIG, SERVICES_CONFIG, SESSION_CONFIG, STORAGE_CONFIG, DERIVATIVES_CONFIG, IMAGE_PROXY_CONFIG, DEADLINE_CONFIG
 from components.score_manager import ScoreManager
 from components.image_selector import ImageSelector
 from components.results_manager import ResultsManager
-from image_analysis import setup_image_routes
+from components.image_stats import ImageStats
+from components.style_aggregates import DEFAULT_COHORT, StyleAggregates
+from components.style_priors import StylePriors
+from deadlines import setup_deadlines
+from catalog_tags import setup_tag_routes
+from derivatives import get_derivative_index
+from metrics import metrics, setup_metrics_routes
+from profiler import setup_profiling
+from profile_store import ProfileStore
+from response_encoding import setup_response_encoding
+from session_manager import SessionManager
+from storage import create_catalog, setup_local_image_routes
 import os
-import json  # Added json import
 from dotenv import load_dotenv
 load_dotenv()
 
-preferences_df = pd.DataFrame(columns=['preference_id', 'access_id', 'ai_id', 'gender', 'current_iteration', 'completed', 'algorithm'])
+PREFERENCE_COLUMNS = ['preference_id', 'access_id', 'ai_id', 'gender', 'cohort', 'current_iteration', 'completed', 'algorithm']
+sessions = SessionManager(PREFERENCE_COLUMNS, stripes=SESSION_CONFIG['lock_stripes'])
+preferences_write_lock = threading.Lock()
+preferences_dirty = threading.Event()
 selections_df = pd.DataFrame(columns=['preference_id', 'iteration', 'image', 'style', 'feedback', 'score_change', 'current_score'])
-profiles_df = pd.DataFrame(columns=['preference_id', 'top_styles', 'selection_history'])
 
 CSV_DIR = '/Users/terminator/Downloads/Data/haider-bhai/algo/data'
 os.makedirs(CSV_DIR, exist_ok=True)
@@ -26,210 +41,640 @@ os.makedirs(CSV_DIR, exist_ok=True)
 PREFERENCES_CSV = os.path.join(CSV_DIR, 'preferences.csv')
 SELECTIONS_CSV = os.path.join(CSV_DIR, 'selections.csv')
 PROFILES_CSV = os.path.join(CSV_DIR, 'profiles.csv')
+PROFILES_DB = os.path.join(CSV_DIR, 'profiles.db')
+AGGREGATES_JSON = os.path.join(CSV_DIR, 'style_aggregates.json')
+PRIORS_JSON = os.path.join(CSV_DIR, 'style_priors.json')
+IMAGE_STATS_BIN = os.path.join(CSV_DIR, 'image_stats.bin')
 
 if os.path.exists(PREFERENCES_CSV):
-    preferences_df = pd.read_csv(PREFERENCES_CSV)
+    sessions.load(pd.read_csv(PREFERENCES_CSV).to_dict('records'))
 if os.path.exists(SELECTIONS_CSV):
     selections_df = pd.read_csv(SELECTIONS_CSV)
-# Near the top of the file, after DataFrame declarations
-if os.path.exists(PROFILES_CSV):
-    profiles_df = pd.read_csv(PROFILES_CSV)
-    # Convert string representations back to Python objects with error handling
-    def safe_json_loads(x):
+# Profiles live in SQLite; an existing profiles.csv is imported the first
+# time the store comes up empty.
+profile_store = ProfileStore(PROFILES_DB, cache_size=PROFILE_STORE_CONFIG['cache_size'])
+if os.path.exists(PROFILES_CSV) and profile_store.count() == 0:
+    migrated, skipped = profile_store.migrate_from_csv(PROFILES_CSV)
+    print(f"Migrated {migrated} profiles from {PROFILES_CSV} ({skipped} unreadable rows skipped)")
+
+style_aggregates = StyleAggregates(shards=AGGREGATES_CONFIG['shards'])
+if os.path.exists(AGGREGATES_JSON):
+    try:
+        style_aggregates.load(AGGREGATES_JSON)
+    except (OSError, ValueError) as e:
+        print(f"Error loading style aggregates: {e}")
+style_aggregates.start_autosave(AGGREGATES_JSON, AGGREGATES_CONFIG['flush_every'], AGGREGATES_CONFIG['flush_seconds'])
+atexit.register(style_aggregates.maybe_save, AGGREGATES_JSON, 1)
+
+image_stats = None
+if IMAGE_STATS_CONFIG['enabled']:
+    image_stats = ImageStats(IMAGE_STATS_BIN, IMAGE_STATS_CONFIG['initial_capacity'])
+    atexit.register(image_stats.flush)
+
+# Priors are loaded once per process and shared read-only by all sessions;
+# build_priors.py regenerates the file from the aggregates.
+style_priors = None
+if PRIORS_CONFIG['enabled'] and os.path.exists(PRIORS_JSON):
+    try:
+        style_priors = StylePriors.load(PRIORS_JSON)
+    except (OSError, ValueError) as e:
+        print(f"Error loading style priors: {e}")
+
+def image_stats_report(gender=None, style=None, limit=None):
+    report = style_aggregates.image_counts(gender, style, limit)
+    if image_stats:
+        for entries in report.values():
+            for entry in entries:
+                summary = image_stats.summary(entry['image'])
+                entry['exposures'] = summary['exposures']
+                entry['information'] = summary['information']
+    return report
+
+def find_preference(preference_id):
+    with metrics.span('preference_lookup'):
+        return sessions.get(preference_id)
+
+def save_preferences():
+    # Each write is a full snapshot, so callers that find a write in
+    # progress leave their change to it (or to the loop below) instead of
+    # queueing up behind the lock.
+    preferences_dirty.set()
+    while preferences_dirty.is_set() and preferences_write_lock.acquire(blocking=False):
         try:
-            if pd.isna(x):
-                return {}
-            return json.loads(str(x).replace("'", '"'))
-        except:
-            return {}
-    
-    profiles_df['top_styles'] = profiles_df['top_styles'].apply(safe_json_loads)
-    profiles_df['selection_history'] = profiles_df['selection_history'].apply(safe_json_loads)
-
-def create_app():
-    app = Flask(__name__)
-    CORS(app, resources={
-        r"/*": {
-            "origins": "*",
-            "methods": ["GET", "POST", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
-        }
+            preferences_dirty.clear()
+            snapshot = pd.DataFrame(sessions.snapshot(), columns=PREFERENCE_COLUMNS)
+            with metrics.span('csv_write', table='preferences'):
+                tmp_path = f"{PREFERENCES_CSV}.tmp"
+                snapshot.to_csv(tmp_path, index=False)
+                os.replace(tmp_path, PREFERENCES_CSV)
+        finally:
+            preferences_write_lock.release()
+
+class StylePreferenceAlgorithm:
+    def __init__(self, gender=None, prior=None, cohort=DEFAULT_COHORT):
+        self.gender = gender
+        self.cohort = cohort
+        self.catalog = create_catalog()
+        self.score_manager = ScoreManager(ALGORITHM_PARAMS)
+        self.image_selector = ImageSelector(
+            ALGORITHM_PARAMS,
+            prior['image_order'] if prior else None,
+            image_stats if IMAGE_STATS_CONFIG['selection_mode'] == 'informative' else None
+        )
+        if prior:
+            self.score_manager.style_scores.update(prior['style_scores'])
+        self.results_manager = ResultsManager()
+        self.user_selections = []
+        self.available_styles = set()
+        self.used_styles = set()
+        self.mandatory_styles = {'classic', 'creative', 'fashionista', 'modern', 'sophisticated', 'street'}
+        self.current_cycle = 0
+        self.styles_in_current_cycle = set()
+        # image_key -> the cycle state its selection changed, so a ticket
+        # that is never claimed can give its style back.
+        self.pending_selections = {}
+
+    def select_next_image(self, gender, available_images):
+        if not self.available_styles:
+            self.available_styles = set(available_images.keys())
+            for style in self.available_styles:
+                if style not in self.score_manager.style_scores:
+                    self.score_manager.style_scores[style] = 0.0
+
+        if not self.styles_in_current_cycle:
+            self.styles_in_current_cycle = self.mandatory_styles.intersection(self.available_styles)
+            self.current_cycle += 1
+
+        if self.styles_in_current_cycle:
+            selected_style = random.choice(list(self.styles_in_current_cycle))
+            if selected_style in available_images and available_images[selected_style]:
+                selected_image = self.image_selector.select_image(available_images, selected_style)
+                if selected_image:
+                    self.mark_selected(selected_image, selected_style, from_cycle=True)
+                    return selected_image, selected_style
+
+        exploration_scores, current_time = self.image_selector.calculate_exploration_scores(
+            available_images,
+            self.score_manager.style_scores,
+            self.score_manager.style_interaction_count,
+            self.score_manager.style_last_shown
+        )
+
+        selected_style = self.image_selector.select_style(exploration_scores, available_images)
+        selected_image = self.image_selector.select_image(available_images, selected_style)
+
+        if not selected_image:
+            remaining_styles = [s for s in self.available_styles if available_images[s]]
+            if remaining_styles:
+                selected_style = random.choice(remaining_styles)
+                selected_image = self.image_selector.select_image(available_images, selected_style)
+
+        if selected_image:
+            self.mark_selected(selected_image, selected_style, from_cycle=False)
+            return selected_image, selected_style
+
+        return None, None
+
+    def mark_selected(self, image_key, style, from_cycle):
+        shown_at = time.time()
+        self.pending_selections[image_key] = (
+            style, self.current_cycle, from_cycle, style in self.used_styles,
+            self.score_manager.style_last_shown.get(style), shown_at
+        )
+        if from_cycle:
+            self.styles_in_current_cycle.remove(style)
+        self.used_styles.add(style)
+        self.score_manager.style_last_shown[style] = shown_at
+
+    def release_selection(self, image_key):
+        # Undoes select_next_image for an image that was never shown. Only
+        # state no later selection has touched is restored.
+        self.image_selector.shown_images.discard(image_key)
+        selection = self.pending_selections.pop(image_key, None)
+        if selection is None:
+            return
+        style, cycle, from_cycle, was_used, last_shown, shown_at = selection
+        if from_cycle and cycle == self.current_cycle:
+            self.styles_in_current_cycle.add(style)
+        if not was_used and not any(pending[0] == style for pending in self.pending_selections.values()):
+            self.used_styles.discard(style)
+        if self.score_manager.style_last_shown.get(style) == shown_at:
+            if last_shown is None:
+                self.score_manager.style_last_shown.pop(style, None)
+            else:
+                self.score_manager.style_last_shown[style] = last_shown
+
+    def update_scores(self, style, feedback, image_key):
+        self.pending_selections.pop(image_key, None)
+        adjusted_weight = self.score_manager.update_scores(style, feedback)
+        current_score = self.score_manager.style_scores[style]
+
+        self.user_selections.append({
+            'image': image_key,
+            'style': style,
+            'feedback': 'Like' if feedback == 'like' else 'Dislike',
+            'score_change': adjusted_weight,
+            'current_score': current_score,
+            'timestamp': time.time()
+        })
+
+        if image_stats:
+            image_stats.record_feedback(image_key, feedback)
+
+        if self.gender:
+            style_aggregates.record(self.gender, style, image_key, feedback, self.cohort)
+
+    def get_selection_history(self):
+        return self.user_selections
+
+    def get_top_styles(self):
+        # Get normalized scores as a list of tuples (style, score)
+        normalized_scores = self.results_manager.normalize_scores(self.score_manager.style_scores)
+        # Convert to dictionary with float values
+        return {style: float(score) for style, score in normalized_scores}
+
+pending_images = {}
+# preference_id -> (iteration, ticket or future resolving to a ticket)
+prefetched_tickets = {}
+
+def generate_ai_id(access_id):
+    return f"AI_{access_id}_{str(uuid.uuid4())[:8]}"
+
+# The helpers below hold the quiz rules shared by the Flask routes and the
+# async app in asgi_app.py. They never touch S3 or disk; callers perform that
+# I/O in between so each server can do it in its own way.
+
+def register_preference(access_id, gender, cohort=None):
+    ai_id = generate_ai_id(access_id)
+    preference_id = str(uuid.uuid4())
+
+    # Only configured cohorts are kept apart so clients cannot grow the
+    # aggregates with arbitrary values.
+    if cohort not in PRIORS_CONFIG['cohorts']:
+        cohort = DEFAULT_COHORT
+    prior = style_priors.for_session(gender, cohort) if style_priors else None
+    algorithm = StylePreferenceAlgorithm(gender, prior, cohort)
+
+    sessions.add({
+        'preference_id': preference_id,
+        'access_id': access_id,
+        'ai_id': ai_id,
+        'gender': gender,
+        'cohort': cohort,
+        'current_iteration': 0,
+        'completed': False,
+        'algorithm': algorithm
     })
-    setup_image_routes(app)
-
-    class StylePreferenceAlgorithm:
-        def __init__(self):
-            self.s3_handler = S3Handler()
-            self.score_manager = ScoreManager(ALGORITHM_PARAMS)
-            self.image_selector = ImageSelector(ALGORITHM_PARAMS)
-            self.results_manager = ResultsManager()
-            self.user_selections = []
-            self.available_styles = set()
-            self.used_styles = set()
-            self.mandatory_styles = {'classic', 'creative', 'fashionista', 'modern', 'sophisticated', 'street'}
-            self.current_cycle = 0
-            self.styles_in_current_cycle = set()
-
-        def select_next_image(self, gender, available_images):
-            if not self.available_styles:
-                self.available_styles = set(available_images.keys())
-                for style in self.available_styles:
-                    if style not in self.score_manager.style_scores:
-                        self.score_manager.style_scores[style] = 0.0
-
-            if not self.styles_in_current_cycle:
-                self.styles_in_current_cycle = self.mandatory_styles.intersection(self.available_styles)
-                self.current_cycle += 1
-
-            if self.styles_in_current_cycle:
-                selected_style = random.choice(list(self.styles_in_current_cycle))
-                if selected_style in available_images and available_images[selected_style]:
-                    selected_image = self.image_selector.select_image(available_images, selected_style)
-                    if selected_image:
-                        self.styles_in_current_cycle.remove(selected_style)
-                        self.used_styles.add(selected_style)
-                        self.score_manager.style_last_shown[selected_style] = time.time()
-                        return selected_image, selected_style
-
-            exploration_scores, current_time = self.image_selector.calculate_exploration_scores(
-                available_images,
-                self.score_manager.style_scores,
-                self.score_manager.style_interaction_count,
-                self.score_manager.style_last_shown
-            )
-
-            selected_style = self.image_selector.select_style(exploration_scores, available_images)
-            selected_image = self.image_selector.select_image(available_images, selected_style)
-
-            if not selected_image:
-                remaining_styles = [s for s in self.available_styles if available_images[s]]
-                if remaining_styles:
-                    selected_style = random.choice(remaining_styles)
-                    selected_image = self.image_selector.select_image(available_images, selected_style)
-
-            if selected_image:
-                self.used_styles.add(selected_style)
-                self.score_manager.style_last_shown[selected_style] = time.time()
-                return selected_image, selected_style
-
-            return None, None
-
-        def update_scores(self, style, feedback, image_key):
-            adjusted_weight = self.score_manager.update_scores(style, feedback)
-            current_score = self.score_manager.style_scores[style]
-
-            self.user_selections.append({
-                'image': image_key,
-                'style': style,
-                'feedback': 'Like' if feedback == 'like' else 'Dislike',
-                'score_change': adjusted_weight,
-                'current_score': current_score,
-                'timestamp': time.time()
-            })
-
-        def get_selection_history(self):
-            return self.user_selections
-
-        def get_top_styles(self):
-            # Get normalized scores as a list of tuples (style, score)
-            normalized_scores = self.results_manager.normalize_scores(self.score_manager.style_scores)
-            # Convert to dictionary with float values
-            return {style: float(score) for style, score in normalized_scores}
-
-    # Existing endpoints remain unchanged here...
-
-    # New First Iteration GET Endpoint
-    @app.route('/api/preference/<preference_id>/iteration/1', methods=['GET'])
-    def get_first_iteration(preference_id):
-        ai_id = request.headers.get('AI-ID')
+    return {
+        'preference_id': preference_id,
+        'ai_id': ai_id
+    }
 
-        try:
-            preference_match = preferences_df[preferences_df['preference_id'] == preference_id]
-            if preference_match.empty:
-                return jsonify({'error': 'Preference not found'}), 404
+def authorize_preference(preference_id, ai_id):
+    preference = find_preference(preference_id)
+    if preference is None:
+        return None, ({'error': 'Preference not found'}, 404)
 
-            preference = preference_match.iloc[0]
-            if preference['ai_id'] != ai_id:
-                return jsonify({'error': 'Invalid AI ID'}), 401
+    if preference['ai_id'] != ai_id:
+        return None, ({'error': 'Invalid AI ID'}, 401)
 
-            if int(preference['current_iteration']) != 0:
-                return jsonify({'error': 'First iteration already completed'}), 400
+    return preference, None
 
-            algorithm = preference['algorithm']
-            available_images = algorithm.s3_handler.get_available_images(preference['gender'])
-            image_key, style = algorithm.select_next_image(preference['gender'], available_images)
+def check_image_request(preference_id, iteration_id, ai_id):
+    preference, error = authorize_preference(preference_id, ai_id)
+    if error:
+        return None, error
+
+    if int(preference['current_iteration']) != iteration_id - 1:
+        if iteration_id == 1:
+            return None, ({'error': 'First iteration already completed'}, 400)
+        return None, ({'error': 'Invalid iteration sequence'}, 400)
+
+    return preference, None
+
+def issue_image_ticket(preference_id, iteration_id, image_key, style, url):
+    unique_image_id = str(uuid.uuid4())
+    pending_images[unique_image_id] = {
+        'image_key': image_key,
+        'style': style,
+        'preference_id': preference_id,
+        'iteration': iteration_id,
+        'timestamp': time.time()
+    }
+
+    return {
+        'image_url': str(url),
+        'image_id': unique_image_id
+    }
+
+def parse_size_class(value):
+    if not value:
+        return None, None
+    if value not in DERIVATIVES_CONFIG['size_classes']:
+        return None, ({'error': f"size must be one of {', '.join(DERIVATIVES_CONFIG['size_classes'])}"}, 400)
+    return value, None
+
+def sized_ticket(ticket, catalog, size_class):
+    # Points the ticket at a pre-sized variant when derivatives.py has
+    # generated one; otherwise the original URL is kept.
+    if not ticket or not size_class or not DERIVATIVES_CONFIG['enabled']:
+        return ticket
+
+    index = get_derivative_index()
+    pending_image = pending_images.get(ticket['image_id'])
+    key = index.lookup(pending_image['image_key'], size_class) if index and pending_image else None
+    if not key:
+        metrics.inc('derivative_lookups', result='miss')
+        return ticket
+
+    metrics.inc('derivative_lookups', result='hit')
+    return dict(ticket, image_url=str(catalog.get_image_url(key)))
+
+def serve_ticket(ticket, catalog, size_class):
+    # Called for every ticket that goes out in a response, so an image's
+    # exposures count how often it was actually sent, answered or not.
+    pending_image = pending_images.get(ticket['image_id']) if ticket else None
+    if image_stats and pending_image:
+        image_stats.record_exposure(pending_image['image_key'])
+    return sized_ticket(ticket, catalog, size_class)
+
+def discard_image_ticket(ticket):
+    # For tickets nobody will claim: the image id stops being answerable,
+    # and the image and its place in the mandatory cycle go back to the session.
+    if not ticket:
+        return
+    pending_image = pending_images.pop(ticket['image_id'], None)
+    preference = find_preference(pending_image['preference_id']) if pending_image else None
+    if preference:
+        # May run from a future's done-callback, so take the session lock.
+        with sessions.lock(preference['preference_id']):
+            preference['algorithm'].release_selection(pending_image['image_key'])
+    metrics.inc('prefetch_discarded')
+
+def discard_prefetched(prefetched):
+    # Accepts a finished ticket or a (thread or asyncio) future for one; a
+    # future that is already running is discarded when it completes.
+    if not hasattr(prefetched, 'add_done_callback'):
+        discard_image_ticket(prefetched)
+        return
+    if prefetched.cancel():
+        return
+
+    def discard_result(future):
+        if not future.cancelled() and future.exception() is None:
+            discard_image_ticket(future.result())
+    prefetched.add_done_callback(discard_result)
+
+def store_prefetched_ticket(preference_id, iteration_id, ticket):
+    previous = prefetched_tickets.get(preference_id)
+    prefetched_tickets[preference_id] = (iteration_id, ticket)
+    if previous is not None and previous[1] is not ticket:
+        discard_prefetched(previous[1])
+
+def pop_prefetched_ticket(preference_id, iteration_id):
+    prefetched = prefetched_tickets.pop(preference_id, None)
+    if prefetched is None or prefetched[0] != iteration_id:
+        if prefetched is not None:
+            discard_prefetched(prefetched[1])
+        metrics.inc('prefetch_lookups', outcome='miss')
+        return None
+    metrics.inc('prefetch_lookups', outcome='hit')
+    return prefetched[1]
+
+def check_feedback_request(preference_id, ai_id, data):
+    feedback = data.get('feedback')
+    image_id = data.get('image_id')
+
+    if not all([ai_id, feedback, image_id]) or feedback not in ['like', 'dislike']:
+        return None, None, ({'error': 'Invalid parameters'}, 400)
+
+    # Checked up front so a bad size for the prefetched image is rejected
+    # like it is on the GET routes, before any feedback is applied.
+    _, error = parse_size_class(data.get('size'))
+    if error:
+        return None, None, error
+
+    if image_id not in pending_images:
+        return None, None, ({'error': 'Invalid or expired image ID'}, 400)
+
+    pending_image = pending_images[image_id]
+    if pending_image['preference_id'] != preference_id:
+        return None, None, ({'error': 'Invalid image ID for this preference'}, 400)
+
+    preference, error = authorize_preference(preference_id, ai_id)
+    return preference, pending_image, error
+
+def parse_batch_count(value):
+    try:
+        count = int(value if value is not None else BATCH_CONFIG['default_count'])
+    except (TypeError, ValueError):
+        return None, ({'error': 'Invalid batch size'}, 400)
+
+    if count < 1 or count > BATCH_CONFIG['max_count']:
+        return None, ({'error': f"Batch size must be between 1 and {BATCH_CONFIG['max_count']}"}, 400)
+
+    return count, None
+
+def check_batch_request(preference_id, ai_id, count):
+    preference, error = authorize_preference(preference_id, ai_id)
+    if error:
+        return None, None, error
+
+    current_iteration = int(preference['current_iteration'])
+    iterations = list(range(current_iteration + 1, min(30, current_iteration + count) + 1))
+    if not iterations:
+        return None, None, ({'error': 'All iterations already completed'}, 400)
+
+    return preference, iterations, None
+
+def check_batch_feedback(preference_id, ai_id, data):
+    entries = data.get('feedback')
+    if not ai_id or not isinstance(entries, list) or not entries:
+        return None, None, ({'error': 'Invalid parameters'}, 400)
+    if len(entries) > BATCH_CONFIG['max_count']:
+        return None, None, ({'error': f"Batch size must be between 1 and {BATCH_CONFIG['max_count']}"}, 400)
+
+    _, error = parse_size_class(data.get('size'))
+    if error:
+        return None, None, error
+
+    preference, error = authorize_preference(preference_id, ai_id)
+    if error:
+        return None, None, error
+
+    # Validate the whole batch before applying any of it so a bad entry
+    # cannot leave the session half-updated.
+    items = []
+    expected_iteration = int(preference['current_iteration']) + 1
+    for entry in entries:
+        feedback = entry.get('feedback') if isinstance(entry, dict) else None
+        image_id = entry.get('image_id') if isinstance(entry, dict) else None
+        if not image_id or feedback not in ['like', 'dislike']:
+            return None, None, ({'error': 'Invalid parameters'}, 400)
+
+        pending_image = pending_images.get(image_id)
+        if pending_image is None:
+            return None, None, ({'error': 'Invalid or expired image ID'}, 400)
+        if pending_image['preference_id'] != preference_id:
+            return None, None, ({'error': 'Invalid image ID for this preference'}, 400)
+        if pending_image['iteration'] != expected_iteration:
+            return None, None, ({'error': 'Invalid iteration sequence'}, 400)
+
+        items.append((image_id, pending_image, feedback))
+        expected_iteration += 1
+
+    return preference, items, None
+
+def apply_feedback(preference, image_id, pending_image, feedback, iteration_id):
+    algorithm = preference['algorithm']
+    algorithm.update_scores(pending_image['style'], feedback, pending_image['image_key'])
+
+    # Update current iteration and completed status
+    preference['current_iteration'] = iteration_id
+    if iteration_id == 30:
+        preference['completed'] = True
+
+    # Clean up
+    pending_images.pop(image_id, None)
+
+    return {
+        'iteration': iteration_id,
+        'completed': iteration_id == 30
+    }
+
+def store_profile(preference_id, algorithm):
+    with metrics.span('profile_write'):
+        profile_store.save(preference_id, algorithm.get_top_styles(), algorithm.get_selection_history())
+
+PROFILE_FIELDS = ('top_styles', 'selection_history')
+HISTORY_FILTERS = ('style', 'feedback', 'from_iteration', 'to_iteration', 'offset', 'limit')
+
+def parse_profile_query(args):
+    fields = args.get('fields')
+    fields = tuple(f.strip() for f in fields.split(',') if f.strip()) if fields else PROFILE_FIELDS
+    if not fields or any(f not in PROFILE_FIELDS for f in fields):
+        return None, ({'error': f"fields must be a subset of {', '.join(PROFILE_FIELDS)}"}, 400)
+
+    query = {'fields': fields, 'paged': any(args.get(name) is not None for name in HISTORY_FILTERS)}
+    query['style'] = args.get('style')
+
+    feedback = args.get('feedback')
+    if feedback and feedback not in ['like', 'dislike']:
+        return None, ({'error': 'Invalid parameters'}, 400)
+    query['feedback'] = 'Like' if feedback == 'like' else 'Dislike' if feedback else None
+
+    max_page = PROFILE_STORE_CONFIG['max_history_page']
+    try:
+        query['from_iteration'] = int(args.get('from_iteration', 1))
+        query['to_iteration'] = int(args.get('to_iteration', 0)) or None
+        query['offset'] = int(args.get('offset', 0))
+        query['limit'] = int(args.get('limit', max_page))
+    except ValueError:
+        return None, ({'error': 'Invalid parameters'}, 400)
+
+    if query['offset'] < 0 or not 1 <= query['limit'] <= max_page:
+        return None, ({'error': f'limit must be between 1 and {max_page}'}, 400)
+
+    return query, None
+
+def profile_etag(preference_id, profile, query):
+    # Depends on the stored version and on the query, so a projection or
+    # history page only revalidates against an identical request.
+    key = f"{preference_id}:{profile.get('updated_at')}:{sorted(query.items())}"
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+def etag_matches(etag, if_none_match):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag for tag in candidates)
+
+def filter_history(selection_history, query):
+    matches = []
+    for iteration, selection in enumerate(selection_history, 1):
+        if iteration < query['from_iteration']:
+            continue
+        if query['to_iteration'] and iteration > query['to_iteration']:
+            break
+        if query['style'] and selection.get('style') != query['style']:
+            continue
+        if query['feedback'] and selection.get('feedback') != query['feedback']:
+            continue
+        matches.append(dict(selection, iteration=iteration))
+
+    start, end = query['offset'], query['offset'] + query['limit']
+    page = {
+        'offset': start,
+        'limit': query['limit'],
+        'total': len(matches),
+        'next_offset': end if end < len(matches) else None
+    }
+    return matches[start:end], page
+
+def read_profile(preference_id, query=None, if_none_match=None):
+    # Returns (body, status, etag); body is None for a 304.
+    if query is None:
+        query, _ = parse_profile_query({})
+
+    with metrics.span('profile_read'):
+        profile = profile_store.get(preference_id)
+    if profile is None:
+        return {'error': 'Profile not found'}, 404, None
+
+    etag = profile_etag(preference_id, profile, query)
+    if etag_matches(etag, if_none_match):
+        metrics.inc('profile_not_modified')
+        return None, 304, etag
+
+    body = {}
+    if 'top_styles' in query['fields']:
+        body['top_styles'] = profile['top_styles']
+    if 'selection_history' in query['fields']:
+        if query['paged']:
+            body['selection_history'], body['history_page'] = filter_history(profile['selection_history'], query)
+        else:
+            body['selection_history'] = profile['selection_history']
+    return body, 200, etag
+
+def setup_quiz_routes(app):
+    metrics.register_gauge('pending_tickets', lambda: len(pending_images))
+    metrics.register_gauge('active_sessions', sessions.active_count)
+
+    prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_CONFIG['threads'], thread_name_prefix='prefetch')
+
+    def next_image_ticket(preference, iteration_id, available_images=None):
+        algorithm = preference['algorithm']
+        if available_images is None:
+            available_images = algorithm.catalog.get_available_images(preference['gender'])
 
+        # Selection mutates the session's algorithm; speculative prefetches
+        # run on other threads, so this always takes the session lock.
+        with sessions.lock(preference['preference_id']):
+            image_key, style = algorithm.select_next_image(preference['gender'], available_images)
             if not image_key:
-                return jsonify({'error': 'No more images available'}), 400
+                return None
 
-            url = algorithm.s3_handler.get_image_url(image_key)
-            unique_image_id = str(uuid.uuid4())
+            url = algorithm.catalog.get_image_url(image_key)
+            return issue_image_ticket(preference['preference_id'], iteration_id, image_key, style, url)
 
-            if not hasattr(app, 'pending_images'):
-                app.pending_images = {}
+    def claim_image_ticket(preference, iteration_id, available_images=None):
+        prefetched = pop_prefetched_ticket(preference['preference_id'], iteration_id)
+        if prefetched is not None:
+            try:
+                ticket = prefetched
+                if isinstance(prefetched, Future):
+                    ticket = prefetched.result(timeout=PREFETCH_CONFIG['wait_seconds'])
+                if ticket:
+                    return ticket
+            except FutureTimeoutError:
+                # Selecting again below; the late ticket must not survive.
+                discard_prefetched(prefetched)
+            except Exception as e:
+                print(f"Error using prefetched image: {e}")
+        return next_image_ticket(preference, iteration_id, available_images)
+
+    def prefetch_next_image(preference, iteration_id, result, inline, size_class=None):
+        if iteration_id >= 30:
+            return
+        next_iteration = iteration_id + 1
+        if inline:
+            ticket = next_image_ticket(preference, next_iteration)
+            store_prefetched_ticket(preference['preference_id'], next_iteration, ticket)
+            ticket = serve_ticket(ticket, preference['algorithm'].catalog, size_class)
+            result['next_image'] = dict(ticket, iteration=next_iteration) if ticket else None
+        elif PREFETCH_CONFIG['speculative']:
+            # Select and sign the next image while the client is still
+            # rendering this response; the GET for the next iteration then
+            # just picks up the finished ticket.
+            future = prefetch_executor.submit(next_image_ticket, preference, next_iteration)
+            store_prefetched_ticket(preference['preference_id'], next_iteration, future)
+
+    @app.route('/api/preference/<preference_id>/iteration/1', methods=['GET'])
+    def get_first_iteration(preference_id):
+        ai_id = request.headers.get('AI-ID')
 
-            app.pending_images[unique_image_id] = {
-                'image_key': image_key,
-                'style': style,
-                'preference_id': preference_id,
-                'iteration': 1,
-                'timestamp': time.time()
-            }
+        size_class, error = parse_size_class(request.args.get('size'))
+        if error:
+            return jsonify(error[0]), error[1]
 
-            return jsonify({
-                'image_url': str(url),
-                'image_id': unique_image_id
-            })
+        try:
+            with sessions.lock(preference_id):
+                preference, error = check_image_request(preference_id, 1, ai_id)
+            if error:
+                return jsonify(error[0]), error[1]
+
+            ticket = claim_image_ticket(preference, 1)
+            if not ticket:
+                return jsonify({'error': 'No more images available'}), 400
+
+            return jsonify(serve_ticket(ticket, preference['algorithm'].catalog, size_class))
 
         except Exception as e:
             return jsonify({'error': f'Failed to get first image: {str(e)}'}), 400
 
-    # New First Iteration POST Endpoint
     @app.route('/api/preference/<preference_id>/iteration/1', methods=['POST'])
     def process_first_iteration(preference_id):
         data = request.get_json()
         ai_id = request.headers.get('AI-ID')
-        feedback = data.get('feedback')
-        image_id = data.get('image_id')
-
-        if not all([ai_id, feedback, image_id]) or feedback not in ['like', 'dislike']:
-            return jsonify({'error': 'Invalid parameters'}), 400
 
         try:
-            if not hasattr(app, 'pending_images') or image_id not in app.pending_images:
-                return jsonify({'error': 'Invalid or expired image ID'}), 400
-
-            pending_image = app.pending_images[image_id]
-            if pending_image['preference_id'] != preference_id:
-                return jsonify({'error': 'Invalid image ID for this preference'}), 400
-
-            preference_match = preferences_df[preferences_df['preference_id'] == preference_id]
-            if preference_match.empty:
-                return jsonify({'error': 'Preference not found'}), 404
-
-            preference = preference_match.iloc[0]
-            if preference['ai_id'] != ai_id:
-                return jsonify({'error': 'Invalid AI ID'}), 401
-
-            algorithm = preference['algorithm']
-            algorithm.update_scores(pending_image['style'], feedback, pending_image['image_key'])
-
-            preferences_df.loc[preferences_df['preference_id'] == preference_id, 'current_iteration'] = 1
-            preferences_df.to_csv(PREFERENCES_CSV, index=False)
-
-            del app.pending_images[image_id]
-
-            return jsonify({
-                'iteration': 1,
-                'completed': False
-            })
+            # Validation and the update happen under one lock so concurrent
+            # submissions of the same image cannot both be applied.
+            with sessions.lock(preference_id):
+                preference, pending_image, error = check_feedback_request(preference_id, ai_id, data)
+                if error:
+                    return jsonify(error[0]), error[1]
+
+                result = apply_feedback(preference, data['image_id'], pending_image, data['feedback'], 1)
+            # Outside the lock: prefetching lists the catalog and signs URLs,
+            # and next_image_ticket locks the session for the selection.
+            prefetch_next_image(preference, 1, result, bool(data.get('prefetch')), data.get('size'))
+            save_preferences()
+            return jsonify(result)
 
         except Exception as e:
             return jsonify({'error': f'Failed to process first iteration: {str(e)}'}), 400
 
-    # Existing endpoints continue unchanged here...
-    # Existing endpoints continued...
-
     @app.route('/api/preference/<preference_id>/iteration/<int:iteration_id>', methods=['GET'])
     def get_iteration_image(preference_id, iteration_id):
         if iteration_id == 1:
@@ -239,44 +684,21 @@ def create_app():
 
         ai_id = request.headers.get('AI-ID')
 
-        try:
-            preference_match = preferences_df[preferences_df['preference_id'] == preference_id]
-            if preference_match.empty:
-                return jsonify({'error': 'Preference not found'}), 404
-
-            preference = preference_match.iloc[0]
-            if preference['ai_id'] != ai_id:
-                return jsonify({'error': 'Invalid AI ID'}), 401
-
-            current_iteration = int(preference['current_iteration'])
-            if current_iteration != iteration_id - 1:
-                return jsonify({'error': 'Invalid iteration sequence'}), 400
+        size_class, error = parse_size_class(request.args.get('size'))
+        if error:
+            return jsonify(error[0]), error[1]
 
-            algorithm = preference['algorithm']
-            available_images = algorithm.s3_handler.get_available_images(preference['gender'])
-            image_key, style = algorithm.select_next_image(preference['gender'], available_images)
+        try:
+            with sessions.lock(preference_id):
+                preference, error = check_image_request(preference_id, iteration_id, ai_id)
+            if error:
+                return jsonify(error[0]), error[1]
 
-            if not image_key:
+            ticket = claim_image_ticket(preference, iteration_id)
+            if not ticket:
                 return jsonify({'error': 'No more images available'}), 400
 
-            url = algorithm.s3_handler.get_image_url(image_key)
-            unique_image_id = str(uuid.uuid4())
-
-            if not hasattr(app, 'pending_images'):
-                app.pending_images = {}
-
-            app.pending_images[unique_image_id] = {
-                'image_key': image_key,
-                'style': style,
-                'preference_id': preference_id,
-                'iteration': iteration_id,
-                'timestamp': time.time()
-            }
-
-            return jsonify({
-                'image_url': str(url),
-                'image_id': unique_image_id
-            })
+            return jsonify(serve_ticket(ticket, preference['algorithm'].catalog, size_class))
 
         except Exception as e:
             return jsonify({'error': f'Failed to get next image: {str(e)}'}), 400
@@ -288,83 +710,94 @@ def create_app():
 
         data = request.get_json()
         ai_id = request.headers.get('AI-ID')
-        feedback = data.get('feedback')
-        image_id = data.get('image_id')
-    
-        if not all([ai_id, feedback, image_id]) or feedback not in ['like', 'dislike']:
-            return jsonify({'error': 'Invalid parameters'}), 400
-    
-        try:
-            if not hasattr(app, 'pending_images') or image_id not in app.pending_images:
-                return jsonify({'error': 'Invalid or expired image ID'}), 400
 
-            pending_image = app.pending_images[image_id]
-            if pending_image['preference_id'] != preference_id:
-                return jsonify({'error': 'Invalid image ID for this preference'}), 400
-
-            preference_match = preferences_df[preferences_df['preference_id'] == preference_id]
-            if preference_match.empty:
-                return jsonify({'error': 'Preference not found'}), 404
-            
-            preference = preference_match.iloc[0]
-            if preference['ai_id'] != ai_id:
-                return jsonify({'error': 'Invalid AI ID'}), 401
+        try:
+            with sessions.lock(preference_id):
+                preference, pending_image, error = check_feedback_request(preference_id, ai_id, data)
+                if error:
+                    return jsonify(error[0]), error[1]
+
+                result = apply_feedback(preference, data['image_id'], pending_image, data['feedback'], iteration_id)
+            # Outside the lock: prefetching lists the catalog and signs URLs,
+            # and next_image_ticket locks the session for the selection.
+            prefetch_next_image(preference, iteration_id, result, bool(data.get('prefetch')), data.get('size'))
+            save_preferences()
+            return jsonify(result)
 
-            algorithm = preference['algorithm']
-            algorithm.update_scores(pending_image['style'], feedback, pending_image['image_key'])
-            
-            # Update current iteration and completed status
-            preferences_df.loc[preferences_df['preference_id'] == preference_id, 'current_iteration'] = iteration_id
-            if iteration_id == 30:
-                preferences_df.loc[preferences_df['preference_id'] == preference_id, 'completed'] = True
-            preferences_df.to_csv(PREFERENCES_CSV, index=False)
-            
-            # Clean up
-            del app.pending_images[image_id]
-            
-            return jsonify({
-                'iteration': iteration_id,
-                'completed': iteration_id == 30
-            })
-            
         except Exception as e:
             return jsonify({'error': f'Failed to process iteration: {str(e)}'}), 400
 
-    @app.route('/api/preference/<preference_id>/profile', methods=['POST'])
-    def save_profile(preference_id):
+    @app.route('/api/preference/<preference_id>/batch', methods=['GET'])
+    def get_image_batch(preference_id):
         ai_id = request.headers.get('AI-ID')
 
-        preference_match = preferences_df[preferences_df['preference_id'] == preference_id]
-        if preference_match.empty:
-            return jsonify({'error': 'Preference not found'}), 404
+        count, error = parse_batch_count(request.args.get('count'))
+        if error:
+            return jsonify(error[0]), error[1]
 
-        preference = preference_match.iloc[0]
-        if preference['ai_id'] != ai_id:
-            return jsonify({'error': 'Invalid AI ID'}), 401
+        size_class, error = parse_size_class(request.args.get('size'))
+        if error:
+            return jsonify(error[0]), error[1]
 
-        if not preference['completed']:
-            return jsonify({'error': 'Profile not completed'}), 400
+        try:
+            with sessions.lock(preference_id):
+                preference, iterations, error = check_batch_request(preference_id, ai_id, count)
+            if error:
+                return jsonify(error[0]), error[1]
 
-        algorithm = preference['algorithm']
-        
-        # Get and format the data
-        top_styles = algorithm.get_top_styles()  # Now returns a dictionary
-        selection_history = algorithm.get_selection_history()
+            # One catalog listing serves the whole batch; selecting the images
+            # one after another keeps the mandatory-style cycle intact.
+            algorithm = preference['algorithm']
+            available_images = algorithm.catalog.get_available_images(preference['gender'])
+            images = []
+            for iteration_id in iterations:
+                ticket = claim_image_ticket(preference, iteration_id, available_images)
+                if not ticket:
+                    break
+                images.append(dict(serve_ticket(ticket, algorithm.catalog, size_class), iteration=iteration_id))
+
+            if not images:
+                return jsonify({'error': 'No more images available'}), 400
 
-        # Remove any existing profile
-        global profiles_df
-        profiles_df = profiles_df[profiles_df['preference_id'] != preference_id]
+            return jsonify({'images': images})
 
-        # Add new profile
-        new_profile = pd.DataFrame([{
-            'preference_id': preference_id,
-            'top_styles': json.dumps(top_styles),
-            'selection_history': json.dumps(selection_history)
-        }])
+        except Exception as e:
+            return jsonify({'error': f'Failed to get image batch: {str(e)}'}), 400
 
-        profiles_df = pd.concat([profiles_df, new_profile], ignore_index=True)
-        profiles_df.to_csv(PROFILES_CSV, index=False)
+    @app.route('/api/preference/<preference_id>/batch', methods=['POST'])
+    def process_feedback_batch(preference_id):
+        data = request.get_json()
+        ai_id = request.headers.get('AI-ID')
+
+        try:
+            with sessions.lock(preference_id):
+                preference, items, error = check_batch_feedback(preference_id, ai_id, data)
+                if error:
+                    return jsonify(error[0]), error[1]
+
+                for image_id, pending_image, feedback in items:
+                    result = apply_feedback(preference, image_id, pending_image, feedback, pending_image['iteration'])
+            prefetch_next_image(preference, result['iteration'], result, bool(data.get('prefetch')), data.get('size'))
+            save_preferences()
+            result['applied'] = len(items)
+            return jsonify(result)
+
+        except Exception as e:
+            return jsonify({'error': f'Failed to process feedback batch: {str(e)}'}), 400
+
+    @app.route('/api/preference/<preference_id>/profile', methods=['POST'])
+    def save_profile(preference_id):
+        ai_id = request.headers.get('AI-ID')
 
+        with sessions.lock(preference_id):
+            preference, error = authorize_preference(preference_id, ai_id)
+            if error:
+                return jsonify(error[0]), error[1]
+
+            if not preference['completed']:
+                return jsonify({'error': 'Profile not completed'}), 400
+
+            store_profile(preference_id, preference['algorithm'])
         return jsonify({'message': 'Profile saved successfully'})
 
     @app.route('/api/preference/<preference_id>/profile', methods=['GET'])
@@ -372,44 +805,43 @@ def create_app():
         ai_id = request.headers.get('AI-ID')
 
         try:
-            preference_match = preferences_df[preferences_df['preference_id'] == preference_id]
-            if preference_match.empty:
-                return jsonify({'error': 'Preference not found'}), 404
+            preference, error = authorize_preference(preference_id, ai_id)
+            if error:
+                return jsonify(error[0]), error[1]
 
-            preference = preference_match.iloc[0]
-            if preference['ai_id'] != ai_id:
-                return jsonify({'error': 'Invalid AI ID'}), 401
+            query, error = parse_profile_query(request.args)
+            if error:
+                return jsonify(error[0]), error[1]
 
-            profile_match = profiles_df[profiles_df['preference_id'] == preference_id]
-            if profile_match.empty:
-                return jsonify({'error': 'Profile not found'}), 404
-
-            profile_data = profile_match.iloc[0]
-            
-            try:
-                top_styles = json.loads(profile_data['top_styles'])
-                selection_history = json.loads(profile_data['selection_history'])
-            except (json.JSONDecodeError, TypeError):
-                return jsonify({'error': 'Invalid profile data format'}), 500
-
-            return jsonify({
-                'top_styles': top_styles,
-                'selection_history': selection_history
-            })
+            body, status, etag = read_profile(preference_id, query, request.headers.get('If-None-Match'))
+            headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'} if etag else {}
+            if status == 304:
+                return '', 304, headers
+            return jsonify(body), status, headers
 
         except Exception as e:
             return jsonify({'error': f'Failed to retrieve profile: {str(e)}'}), 400
-    # Health-check and Preference creation endpoints (as in original provided code):
-    def generate_ai_id(access_id):
-        return f"AI_{access_id}_{str(uuid.uuid4())[:8]}"
-    
-    @app.route('/api')
-    def health_check():
-        return jsonify({'status': 'ok'})
+
+    @app.route('/api/stats/styles', methods=['GET'])
+    def get_style_stats():
+        gender = request.args.get('gender')
+        if gender and gender not in ['men', 'women']:
+            return jsonify({'error': 'Invalid parameters'}), 400
+        return jsonify({'styles': style_aggregates.style_counts(gender)})
+
+    @app.route('/api/stats/images', methods=['GET'])
+    def get_image_stats():
+        gender = request.args.get('gender')
+        if gender and gender not in ['men', 'women']:
+            return jsonify({'error': 'Invalid parameters'}), 400
+        try:
+            limit = int(request.args.get('limit', 50))
+        except ValueError:
+            return jsonify({'error': 'Invalid parameters'}), 400
+        return jsonify({'images': image_stats_report(gender, request.args.get('style'), limit)})
 
     @app.route('/api/preference', methods=['POST'])
     def create_preference():
-        global preferences_df
         data = request.get_json()
         access_id = data.get('access_id')
         gender = data.get('gender')
@@ -417,28 +849,45 @@ def create_app():
         if not access_id or gender not in ['men', 'women']:
             return jsonify({'error': 'Invalid parameters'}), 400
 
-        ai_id = generate_ai_id(access_id)
-        preference_id = str(uuid.uuid4())
-
-        algorithm = StylePreferenceAlgorithm()
+        result = register_preference(access_id, gender, data.get('cohort'))
+        save_preferences()
+        return jsonify(result)
 
-        new_preference = pd.DataFrame([{
-            'preference_id': preference_id,
-            'access_id': access_id,
-            'ai_id': ai_id,
-            'gender': gender,
-            'current_iteration': 0,
-            'completed': False,
-            'algorithm': algorithm
-        }])
-
-        preferences_df = pd.concat([preferences_df, new_preference], ignore_index=True)
-        preferences_df.to_csv(PREFERENCES_CSV, index=False)
+def create_app(services=None):
+    services = services or SERVICES_CONFIG['enabled']
+    unknown = [name for name in services if name not in ('quiz', 'image')]
+    if unknown:
+        raise ValueError(f"Unknown services: {', '.join(unknown)} (expected quiz, image)")
+    app = Flask(__name__)
+    CORS(app, resources={
+        r"/*": {
+            "origins": "*",
+            "methods": ["GET", "POST", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization", DEADLINE_CONFIG['header']]
+        }
+    })
+    setup_deadlines(app)
+    setup_metrics_routes(app)
+    setup_response_encoding(app)
+    if PROFILING_CONFIG['enabled']:
+        setup_profiling(app)
+
+    if 'quiz' in services:
+        setup_quiz_routes(app)
+        setup_tag_routes(app)
+        if STORAGE_CONFIG['backend'] == 'local':
+            setup_local_image_routes(app)
+        if IMAGE_PROXY_CONFIG['enabled']:
+            from image_cache import setup_image_proxy_routes
+            setup_image_proxy_routes(app)
+    if 'image' in services:
+        # Imported here so quiz-only processes never load the image stack.
+        from image_analysis import setup_image_routes
+        setup_image_routes(app)
 
-        return jsonify({
-            'preference_id': preference_id,
-            'ai_id': ai_id
-        })
+    @app.route('/api')
+    def health_check():
+        return jsonify({'status': 'ok'})
 
     return app
 
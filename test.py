@@ -1,15 +1,32 @@
-from transformers import AutoImageProcessor, AutoModelForImageClassification
-from PIL import Image
 import requests
 
-url = 'http://images.cocodataset.org/val2017/000000039769.jpg'
-image = Image.open(requests.get(url, stream=True).raw)
+MODEL_NAME = 'facebook/dinov2-large-imagenet1k-1-layer'
 
-processor = AutoImageProcessor.from_pretrained('facebook/dinov2-large-imagenet1k-1-layer')
-model = AutoModelForImageClassification.from_pretrained('facebook/dinov2-large-imagenet1k-1-layer')
+_processor = None
+_model = None
 
-inputs = processor(images=image, return_tensors="pt")
-outputs = model(**inputs)
-logits = outputs.logits
-predicted_class_idx = logits.argmax(-1).item()
-print("Predicted class:", model.config.id2label[predicted_class_idx])
+def load_model():
+    # transformers/torch take seconds to import and the model is large, so
+    # both are loaded on the first classification rather than at import.
+    global _processor, _model
+    if _model is None:
+        from transformers import AutoImageProcessor, AutoModelForImageClassification
+        _processor = AutoImageProcessor.from_pretrained(MODEL_NAME)
+        _model = AutoModelForImageClassification.from_pretrained(MODEL_NAME)
+    return _processor, _model
+
+def classify_image(url):
+    from PIL import Image
+
+    processor, model = load_model()
+    image = Image.open(requests.get(url, stream=True).raw)
+
+    inputs = processor(images=image, return_tensors="pt")
+    outputs = model(**inputs)
+    logits = outputs.logits
+    predicted_class_idx = logits.argmax(-1).item()
+    return model.config.id2label[predicted_class_idx]
+
+if __name__ == "__main__":
+    url = 'http://images.cocodataset.org/val2017/000000039769.jpg'
+    print("Predicted class:", classify_image(url))
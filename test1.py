@@ -5,8 +5,8 @@ import uuid
 import pandas as pd
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from s3_handler import S3Handler
-from config import ALGORITHM_PARAMS
+from config import ALGORITHM_PARAMS, STORAGE_CONFIG
+from storage import create_catalog, setup_local_image_routes
 from components.score_manager import ScoreManager
 from components.image_selector import ImageSelector
 from components.results_manager import ResultsManager
@@ -16,6 +16,8 @@ load_dotenv()
 
 app = Flask(__name__)
 CORS(app)  # Add this line after creating the Flask app
+if STORAGE_CONFIG['backend'] == 'local':
+    setup_local_image_routes(app)
 
 # In-memory storage using pandas DataFrames
 preferences_df = pd.DataFrame(columns=['preference_id', 'access_id', 'ai_id', 'gender', 'current_iteration', 'completed', 'algorithm'])
@@ -24,7 +26,7 @@ profiles_df = pd.DataFrame(columns=['preference_id', 'top_styles', 'selection_hi
 
 class StylePreferenceAlgorithm:
     def __init__(self):
-        self.s3_handler = S3Handler()
+        self.catalog = create_catalog()
         self.score_manager = ScoreManager(ALGORITHM_PARAMS)
         self.image_selector = ImageSelector(ALGORITHM_PARAMS)
         self.results_manager = ResultsManager()
@@ -74,7 +76,7 @@ def run_style_quiz():
         print("Invalid input. Please enter 'men' or 'women'.")
 
     algorithm = StylePreferenceAlgorithm()
-    available_images = algorithm.s3_handler.get_available_images(gender)
+    available_images = algorithm.catalog.get_available_images(gender)
     
     if not available_images:
         print("No images available. Please check the connection and try again.")
@@ -86,7 +88,7 @@ def run_style_quiz():
             print("No more unique images available.")
             break
 
-        url = algorithm.s3_handler.get_image_url(image_key)
+        url = algorithm.catalog.get_image_url(image_key)
         if not url:
             continue
 
@@ -171,12 +173,12 @@ def process_iteration(preference_id, iteration_id):
         })
     
     # Normal iteration processing
-    available_images = algorithm.s3_handler.get_available_images(preference['gender'])
+    available_images = algorithm.catalog.get_available_images(preference['gender'])
     image_key, style = algorithm.select_next_image(preference['gender'], available_images)
     if not image_key:
         return jsonify({'error': 'No more images available'}), 400
     
-    url = algorithm.s3_handler.get_image_url(image_key)
+    url = algorithm.catalog.get_image_url(image_key)
     algorithm.update_scores(style, feedback, image_key)
     
     # Update current iteration